@@ -1,9 +1,17 @@
 from django.contrib import admin
+from django.db.models import Q
 
+from . import search
+from .forms import StockTransferForm
 from .models import (
+    ClientGroup,
     GlassCategory,
     GlassType,
+    Location,
     Partner,
+    PriceList,
+    PriceRule,
+    StockTransfer,
     WarehouseBalance,
     WarehouseReceipt,
 )
@@ -11,10 +19,43 @@ from .models import (
 
 @admin.register(Partner)
 class PartnerAdmin(admin.ModelAdmin):
-    list_display = ("name", "partner_type", "phone", "created_at")
-    list_filter = ("partner_type",)
+    list_display = ("name", "partner_type", "client_group", "phone", "created_at")
+    list_filter = ("partner_type", "client_group")
     search_fields = ("name", "phone", "address")
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not search.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        ids = search.search_subquery(search.KIND_PARTNER, search_term)
+        if ids is None:
+            return queryset.none(), False
+        return queryset.filter(pk__in=ids), False
+
+
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    list_display = ("name", "address")
+    search_fields = ("name", "address")
+
+
+@admin.register(ClientGroup)
+class ClientGroupAdmin(admin.ModelAdmin):
+    search_fields = ("name",)
+
+
+class PriceRuleInline(admin.TabularInline):
+    model = PriceRule
+    extra = 1
+    autocomplete_fields = ("glass_type",)
+
+
+@admin.register(PriceList)
+class PriceListAdmin(admin.ModelAdmin):
+    list_display = ("name", "client_group", "is_active", "updated_at")
+    list_filter = ("is_active", "client_group")
+    search_fields = ("name",)
+    inlines = (PriceRuleInline,)
+
 
 @admin.register(GlassCategory)
 class GlassCategoryAdmin(admin.ModelAdmin):
@@ -31,6 +72,7 @@ class GlassTypeAdmin(admin.ModelAdmin):
 @admin.register(WarehouseReceipt)
 class WarehouseReceiptAdmin(admin.ModelAdmin):
     list_display = (
+        "location",
         "glass_type",
         "supplier",
         "quantity",
@@ -41,12 +83,38 @@ class WarehouseReceiptAdmin(admin.ModelAdmin):
         "total_amount",
         "created_at",
     )
-    list_filter = ("glass_type__category", "glass_type", "supplier", "created_at")
-    search_fields = ("glass_type__name", "supplier__name")
+    list_filter = ("location", "glass_type__category", "glass_type", "supplier", "created_at")
+    search_fields = ("product_code", "glass_type__name", "supplier__name")
     readonly_fields = ("total_volume_m2", "created_at")
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not search.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        receipt_ids = search.search_subquery(search.KIND_PRODUCT_CODE, search_term)
+        if receipt_ids is None:
+            return queryset.none(), False
+        glass_type_ids = search.search_subquery(search.KIND_GLASS_TYPE, search_term)
+        supplier_ids = search.search_subquery(search.KIND_PARTNER, search_term, scope=Partner.SUPPLIER)
+        return (
+            queryset.filter(
+                Q(pk__in=receipt_ids)
+                | Q(glass_type_id__in=glass_type_ids)
+                | Q(supplier_id__in=supplier_ids)
+            ),
+            False,
+        )
+
 
 @admin.register(WarehouseBalance)
 class WarehouseBalanceAdmin(admin.ModelAdmin):
-    list_display = ("glass_type", "total_sheets", "total_volume_m2")
-    readonly_fields = ("glass_type", "total_sheets", "total_volume_m2")
\ No newline at end of file
+    list_display = ("location", "glass_type", "total_sheets", "total_volume_m2")
+    list_filter = ("location",)
+    readonly_fields = ("location", "glass_type", "total_sheets", "total_volume_m2")
+
+
+@admin.register(StockTransfer)
+class StockTransferAdmin(admin.ModelAdmin):
+    form = StockTransferForm
+    list_display = ("warehouse_sheet", "from_location", "to_location", "created_at")
+    list_filter = ("from_location", "to_location")
+    readonly_fields = ("from_location", "created_at")
\ No newline at end of file
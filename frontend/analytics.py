@@ -0,0 +1,173 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import DecimalField, F, Func, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Order, WarehouseReceipt, WarehouseSheet, WasteRecord
+
+CACHE_TIMEOUT = 60 * 60
+UNVERSIONED_CACHE_TIMEOUT = 5 * 60
+AGE_BUCKETS = [(0, 30, "до 30 дн."), (31, 90, "31–90 дн."), (91, 180, "91–180 дн."), (181, None, "более 180 дн.")]
+
+ZERO = Decimal("0.000")
+
+
+def _receipt_total(queryset, receipt_field, function, field, output_field):
+    # One receipt's rows only, so no GROUP BY: SQLite can then drive the
+    # subquery from the location index without a temporary b-tree.
+    return Subquery(
+        queryset.filter(**{receipt_field: OuterRef("pk")})
+        .order_by()
+        .annotate(total=Func(F(field), function=function, output_field=output_field))
+        .values("total")[:1]
+    )
+
+
+def _volume_subquery(queryset, receipt_field, volume_field):
+    volume = DecimalField(max_digits=14, decimal_places=3)
+    return Coalesce(_receipt_total(queryset, receipt_field, "SUM", volume_field, volume), Value(ZERO), output_field=volume)
+
+
+def _count_subquery(queryset, receipt_field):
+    return _receipt_total(queryset, receipt_field, "COUNT", "pk", IntegerField())
+
+
+def _age_bucket(age_days):
+    for index, (low, high, _) in enumerate(AGE_BUCKETS):
+        if age_days >= low and (high is None or age_days <= high):
+            return index
+    return len(AGE_BUCKETS) - 1
+
+
+def _percent(part, whole):
+    if not whole:
+        return Decimal("0.0")
+    return (Decimal(part) * 100 / Decimal(whole)).quantize(Decimal("0.1"))
+
+
+def _empty_group(label):
+    return {
+        "label": label,
+        "received_m2": ZERO,
+        "ordered_m2": ZERO,
+        "waste_m2": ZERO,
+        "idle_m2": ZERO,
+        "idle_age_weight": Decimal("0"),
+        "oldest_idle_days": None,
+    }
+
+
+def _finish_group(group):
+    group["used_percent"] = _percent(group["ordered_m2"], group["received_m2"])
+    group["waste_percent"] = _percent(group["waste_m2"], group["received_m2"])
+    group["idle_percent"] = _percent(group["idle_m2"], group["received_m2"])
+    group["avg_idle_age_days"] = (
+        int(group["idle_age_weight"] / group["idle_m2"]) if group["idle_m2"] else None
+    )
+    del group["idle_age_weight"]
+    return group
+
+
+def compute_utilization(location, today=None):
+    today = today or timezone.localdate()
+    # Everything is counted where the sheet is now: transfers move whole uncut
+    # sheets, and orders and waste are booked where the sheet was cut.
+    sheets_here = WarehouseSheet.objects.filter(location=location)
+    receipts = (
+        WarehouseReceipt.objects.filter(pk__in=sheets_here.order_by().values("receipt_id"))
+        .order_by()
+        .annotate(
+            sheets_here=_count_subquery(sheets_here, "receipt"),
+            idle_m2=_volume_subquery(sheets_here.filter(remaining_volume_m2__gt=0), "receipt", "remaining_volume_m2"),
+            ordered_m2=_volume_subquery(
+                Order.objects.filter(location=location, is_consumed=True), "warehouse_sheet__receipt", "order_volume_m2"
+            ),
+            waste_m2=_volume_subquery(
+                WasteRecord.objects.filter(location=location), "warehouse_sheet__receipt", "waste_volume_m2"
+            ),
+        )
+        .values_list(
+            "pk",
+            "product_code",
+            "created_at",
+            "width_mm",
+            "height_mm",
+            "sheets_here",
+            "supplier__name",
+            "glass_type__category__name",
+            "glass_type__name",
+            "idle_m2",
+            "ordered_m2",
+            "waste_m2",
+        )
+    )
+
+    receipt_rows = []
+    by_supplier = {}
+    by_glass_type = {}
+    heatmap = defaultdict(lambda: [ZERO] * len(AGE_BUCKETS))
+    for (
+        pk, product_code, created_at, width_mm, height_mm, sheets_count, supplier, category, glass_type, idle, ordered, waste
+    ) in receipts:
+        received = WarehouseReceipt(width_mm=width_mm, height_mm=height_mm).sheet_volume_m2 * sheets_count
+        age_days = (today - timezone.localdate(created_at)).days
+        glass_type_label = f"{category} / {glass_type}"
+        row = {
+            "label": f"#{pk} {product_code}",
+            "supplier": supplier,
+            "glass_type": glass_type_label,
+            "created_at": created_at,
+            "age_days": age_days,
+            "received_m2": received,
+            "ordered_m2": ordered,
+            "waste_m2": waste,
+            "idle_m2": idle,
+            "idle_age_weight": idle * age_days,
+            "oldest_idle_days": age_days if idle else None,
+        }
+        for groups, key in ((by_supplier, supplier), (by_glass_type, glass_type_label)):
+            group = groups.setdefault(key, _empty_group(key))
+            for field in ("received_m2", "ordered_m2", "waste_m2", "idle_m2", "idle_age_weight"):
+                group[field] += row[field]
+            if idle:
+                group["oldest_idle_days"] = max(group["oldest_idle_days"] or 0, age_days)
+        if idle:
+            heatmap[glass_type_label][_age_bucket(age_days)] += idle
+        receipt_rows.append(_finish_group(row))
+
+    receipt_rows.sort(key=lambda row: (-row["idle_m2"], -row["age_days"]))
+    max_cell = max((value for values in heatmap.values() for value in values), default=ZERO)
+    return {
+        "receipts": receipt_rows,
+        "suppliers": sorted((_finish_group(group) for group in by_supplier.values()), key=lambda group: group["label"]),
+        "glass_types": sorted(
+            (_finish_group(group) for group in by_glass_type.values()), key=lambda group: group["label"]
+        ),
+        "age_buckets": [label for _, _, label in AGE_BUCKETS],
+        "heatmap": [
+            {
+                "label": label,
+                "cells": [
+                    {"idle_m2": value, "intensity": (value / max_cell).quantize(Decimal("0.01")) if max_cell else 0}
+                    for value in values
+                ],
+            }
+            for label, values in sorted(heatmap.items())
+        ],
+    }
+
+
+def utilization(location, version=None):
+    today = timezone.localdate()
+    if version is None:
+        return cache.get_or_set(
+            f"utilization:{location.pk}:{today}",
+            lambda: compute_utilization(location, today),
+            UNVERSIONED_CACHE_TIMEOUT,
+        )
+    return cache.get_or_set(
+        f"utilization:{location.pk}:{today}:{version}", lambda: compute_utilization(location, today), CACHE_TIMEOUT
+    )
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+
+KEEPALIVE_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Broadcaster:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, event_type, data):
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, (event_type, data))
+
+    @staticmethod
+    def _deliver(queue, event):
+        # A client that stopped reading loses old deltas instead of growing memory.
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+class LocalBroadcaster:
+    def __init__(self):
+        self.events = []
+        self.queues = []
+
+    def subscribe(self):
+        queue = asyncio.Queue()
+        self.queues.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.queues.remove(queue)
+
+    def publish(self, event_type, data):
+        self.events.append((event_type, data))
+        for queue in self.queues:
+            queue.put_nowait((event_type, data))
+
+
+_broadcaster = Broadcaster()
+
+
+def get_broadcaster():
+    return _broadcaster
+
+
+def set_broadcaster(broadcaster):
+    global _broadcaster
+    previous = _broadcaster
+    _broadcaster = broadcaster
+    return previous
+
+
+def publish(event_type, data):
+    _broadcaster.publish(event_type, data)
+
+
+def format_event(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+
+async def sse_application(scope, receive, send):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+
+    broadcaster = get_broadcaster()
+    queue = broadcaster.subscribe()
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({"type": "http.response.body", "body": b": connected\n\n", "more_body": True})
+        while not disconnect.done():
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnect}, timeout=KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            if next_event in done:
+                await send({"type": "http.response.body", "body": format_event(*next_event.result()), "more_body": True})
+                continue
+            next_event.cancel()
+            if not done:
+                await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+    finally:
+        broadcaster.unsubscribe(queue)
+        disconnect.cancel()
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
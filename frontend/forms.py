@@ -1,8 +1,21 @@
+from decimal import Decimal
+
 from django import forms
 from django.forms.models import ModelChoiceIteratorValue
-from django.db.models import Q
-
-from .models import GlassCategory, GlassType, Order, Partner, WarehouseReceipt, WarehouseSheet
+from django.db.models import Exists, OuterRef, Q
+from django.urls import reverse
+
+from . import pricing, quoting
+from .models import (
+    GlassCategory,
+    GlassType,
+    Location,
+    Order,
+    Partner,
+    StockTransfer,
+    WarehouseReceipt,
+    WarehouseSheet,
+)
 
 
 class StyledModelForm(forms.ModelForm):
@@ -15,6 +28,18 @@ class StyledModelForm(forms.ModelForm):
             widget.attrs["class"] = f"{css} {base_class}".strip()
 
 
+class LocationFormMixin:
+    def __init__(self, *args, location=None, **kwargs):
+        self.location = location
+        super().__init__(*args, **kwargs)
+
+    def location_sheets(self):
+        sheets = WarehouseSheet.objects.filter(remaining_volume_m2__gt=0)
+        if self.location is not None:
+            sheets = sheets.filter(location=self.location)
+        return sheets.select_related("glass_type", "glass_type__category")
+
+
 class WarehouseSheetSelect(forms.Select):
     def __init__(self, *args, sheet_map=None, **kwargs):
         self.sheet_map = sheet_map or {}
@@ -39,10 +64,24 @@ class WarehouseSheetSelect(forms.Select):
         return option
 
 
+class PartnerSearchSelect(forms.Select):
+    def __init__(self, *args, queryset=None, empty_label="", **kwargs):
+        self.queryset = queryset
+        self.empty_label = empty_label
+        super().__init__(*args, **kwargs)
+
+    def optgroups(self, name, value, attrs=None):
+        selected_ids = [item for item in value if str(item).isdigit()]
+        self.choices = [("", self.empty_label)] + [
+            (partner.pk, partner.name) for partner in self.queryset.filter(pk__in=selected_ids)
+        ]
+        return super().optgroups(name, value, attrs)
+
+
 class PartnerForm(StyledModelForm):
     class Meta:
         model = Partner
-        fields = ["partner_type", "name", "phone", "address", "note"]
+        fields = ["partner_type", "name", "phone", "address", "client_group", "note"]
 
 
 class GlassCategoryForm(StyledModelForm):
@@ -57,7 +96,7 @@ class GlassTypeForm(StyledModelForm):
         fields = ["category", "name"]
 
 
-class WarehouseReceiptForm(StyledModelForm):
+class WarehouseReceiptForm(LocationFormMixin, StyledModelForm):
     category = forms.ModelChoiceField(queryset=GlassCategory.objects.all(), label="Категория")
 
     class Meta:
@@ -81,12 +120,14 @@ class WarehouseReceiptForm(StyledModelForm):
         instance = super().save(commit=False)
         category = self.cleaned_data["category"]
         instance.glass_type, _ = GlassType.objects.get_or_create(category=category, name=category.name)
+        if self.location is not None:
+            instance.location = self.location
         if commit:
             instance.save()
         return instance
 
 
-class OrderForm(StyledModelForm):
+class OrderForm(LocationFormMixin, StyledModelForm):
     client = forms.ModelChoiceField(
         queryset=Partner.objects.filter(partner_type=Partner.CLIENT),
         required=False,
@@ -114,11 +155,21 @@ class OrderForm(StyledModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        warehouse_sheets = WarehouseSheet.objects.filter(remaining_volume_m2__gt=0).select_related(
-            "glass_type", "glass_type__category"
-        )
+        warehouse_sheets = self.location_sheets()
         self.fields["warehouse_sheet"].queryset = warehouse_sheets
         self.fields["client"].empty_label = "— Выберите клиента из базы —"
+        self.fields["price_per_m2"].required = False
+        self.fields["price_per_m2"].help_text = "Оставьте пустым, чтобы взять цену из прайс-листа."
+        self.fields["client"].widget = PartnerSearchSelect(
+            attrs={
+                **self.fields["client"].widget.attrs,
+                "data-search-url": reverse("search"),
+                "data-search-kind": "partner",
+                "data-search-scope": Partner.CLIENT,
+            },
+            queryset=self.fields["client"].queryset,
+            empty_label=self.fields["client"].empty_label,
+        )
         self.fields["warehouse_sheet"].empty_label = "— Выберите лист со склада —"
 
         self.fields["warehouse_sheet"].widget = WarehouseSheetSelect(
@@ -158,7 +209,8 @@ class OrderForm(StyledModelForm):
             width <= sheet.height_mm and height <= sheet.width_mm
         )
 
-    def _sheet_label(self, sheet):
+    @staticmethod
+    def _sheet_label(sheet):
         return (
             f"{sheet.glass_type.category.name} / {sheet.product_code} / {sheet.width_mm}×{sheet.height_mm} мм / "
             f"{sheet.thickness_mm} мм / остаток {sheet.remaining_volume_m2} м²"
@@ -184,6 +236,18 @@ class OrderForm(StyledModelForm):
         if sheet:
             cleaned_data["thickness_mm"] = sheet.thickness_mm
 
+        if sheet and width and height and cleaned_data.get("price_per_m2") is None:
+            price = pricing.resolve_price(
+                sheet.glass_type_id,
+                sheet.thickness_mm,
+                client_group_id=client.client_group_id if client else None,
+                volume_m2=Decimal(quoting.area_units(width, height)).scaleb(-3),
+            )
+            if price is None:
+                self.add_error("price_per_m2", "Для этого стекла нет цены в прайс-листе, укажите цену вручную.")
+            else:
+                cleaned_data["price_per_m2"] = price
+
         return cleaned_data
 
     def save(self, commit=True):
@@ -198,4 +262,26 @@ class OrderForm(StyledModelForm):
             )
         if commit:
             instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+
+class StockTransferForm(LocationFormMixin, StyledModelForm):
+    class Meta:
+        model = StockTransfer
+        fields = ["warehouse_sheet", "to_location", "note"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        open_orders = Order.objects.filter(warehouse_sheet=OuterRef("pk")).exclude(status=Order.STATUS_CANCELLED)
+        self.fields["warehouse_sheet"].queryset = self.location_sheets().exclude(Exists(open_orders))
+        self.fields["warehouse_sheet"].label_from_instance = OrderForm._sheet_label
+        self.fields["warehouse_sheet"].empty_label = "— Выберите лист —"
+        if self.location is not None:
+            self.fields["to_location"].queryset = Location.objects.exclude(pk=self.location.pk)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        sheet = cleaned_data.get("warehouse_sheet")
+        if sheet:
+            self.instance.from_location = sheet.location
+        return cleaned_data
@@ -0,0 +1,94 @@
+import re
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.utils import timezone
+
+from .models import DeletedSheet, GlassType, StockTransfer, WarehouseBalance, WarehouseSheet
+
+SHEET_FIELDS = ["id", "glass_type_id", "product_code", "width_mm", "height_mm", "thickness_mm", "remaining_volume_m2"]
+BALANCE_FIELDS = ["glass_type_id", "total_sheets", "total_volume_m2"]
+DECIMAL_FIELDS = {"thickness_mm", "remaining_volume_m2", "total_volume_m2"}
+
+# Rows saved by a transaction that started before the previous token was issued
+# may commit with an older updated_at; re-sending a short window keeps them.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+TOKEN_RE = re.compile(r"[0-9]+\Z", re.ASCII)
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def make_token(moment):
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def parse_token(token):
+    if not token or not TOKEN_RE.match(str(token)):
+        raise InvalidToken("Некорректный токен синхронизации.")
+    try:
+        return datetime.fromtimestamp(int(token) / 1_000_000, tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        raise InvalidToken("Некорректный токен синхронизации.")
+
+
+def _serialize(fields, row):
+    return [str(value) if field in DECIMAL_FIELDS else value for field, value in zip(fields, row)]
+
+
+def _rows(queryset, fields):
+    return [_serialize(fields, row) for row in queryset.values_list(*fields)]
+
+
+def snapshot(location):
+    token = make_token(timezone.now())
+    sheets = WarehouseSheet.objects.filter(location=location, remaining_volume_m2__gt=0).order_by()
+    balances = WarehouseBalance.objects.filter(location=location).order_by()
+    return {
+        "token": token,
+        "location_id": location.pk,
+        "glass_types": {
+            glass_type_id: f"{category_name} / {name}"
+            for glass_type_id, category_name, name in GlassType.objects.values_list("pk", "category__name", "name")
+        },
+        "sheet_fields": SHEET_FIELDS,
+        "sheets": _rows(sheets, SHEET_FIELDS),
+        "balance_fields": BALANCE_FIELDS,
+        "balances": _rows(balances, BALANCE_FIELDS),
+    }
+
+
+def changes(location, token):
+    since = parse_token(token) - SYNC_OVERLAP
+    next_token = make_token(timezone.now())
+
+    changed_sheets = WarehouseSheet.objects.filter(location=location, updated_at__gte=since).order_by()
+    updated = []
+    removed = set(
+        StockTransfer.objects.filter(from_location=location, created_at__gte=since).values_list(
+            "warehouse_sheet_id", flat=True
+        )
+    )
+    removed.update(
+        DeletedSheet.objects.filter(location=location, deleted_at__gte=since).values_list("sheet_id", flat=True)
+    )
+    for sheet in changed_sheets.values_list(*SHEET_FIELDS):
+        if sheet[-1] > 0:
+            updated.append(_serialize(SHEET_FIELDS, sheet))
+        else:
+            removed.add(sheet[0])
+    removed -= {sheet[0] for sheet in updated}
+
+    balances = WarehouseBalance.objects.filter(location=location, updated_at__gte=since).order_by()
+    return {
+        "token": next_token,
+        "location_id": location.pk,
+        "sheet_fields": SHEET_FIELDS,
+        "sheets": updated,
+        "removed_sheet_ids": sorted(removed),
+        "balance_fields": BALANCE_FIELDS,
+        "balances": _rows(balances, BALANCE_FIELDS),
+        "sheet_count": WarehouseSheet.objects.filter(location=location, remaining_volume_m2__gt=0).count(),
+    }
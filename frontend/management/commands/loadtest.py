@@ -0,0 +1,310 @@
+import os
+import random
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http.client import HTTPException
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, build_opener
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from frontend.models import (
+    GlassCategory,
+    Partner,
+    WarehouseBalance,
+    WarehouseSheet,
+    aggregate_warehouse_balances,
+)
+
+BROWSE_URLS = ["/warehouse/", "/orders/", "/counterparty/", "/warehouse/categories/", "/warehouse/utilization/"]
+SCENARIO_WEIGHTS = {"browse": 60, "create_receipt": 15, "create_order": 25}
+WRITE_OPERATIONS = {"create_receipt", "create_order"}
+LOCK_MARKERS = (b"database is locked", b"database table is locked")
+CSRF_RE = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class LoadClient:
+    def __init__(self, base_url, fixtures, stats):
+        self.base_url = base_url
+        self.fixtures = fixtures
+        self.stats = stats
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirect())
+        self.csrf_token = None
+
+    def request(self, operation, path, data=None):
+        body = urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=30) as response:
+                status, content = response.status, response.read()
+        except HTTPError as error:
+            status, content = error.code, error.read()
+        except (OSError, HTTPException):
+            status, content = 0, b""
+        self.stats.record(operation, status, time.perf_counter() - started, content)
+        match = CSRF_RE.search(content)
+        if match:
+            self.csrf_token = match.group(1).decode()
+        return status
+
+    def browse(self):
+        self.request("browse", random.choice(BROWSE_URLS))
+
+    def create_receipt(self):
+        if not self.csrf_token:
+            self.request("browse", "/warehouse/")
+        self.request(
+            "create_receipt",
+            "/warehouse/",
+            {
+                "csrfmiddlewaretoken": self.csrf_token,
+                "action": "create_receipt",
+                "category": random.choice(self.fixtures["category_ids"]),
+                "product_code": f"LT-{random.randint(1, 20)}",
+                "supplier": self.fixtures["supplier_id"],
+                "width_mm": random.choice([2000, 2250, 3210]),
+                "height_mm": random.choice([1500, 1605, 2250]),
+                "thickness_mm": random.choice(["4", "5", "6"]),
+                "quantity": random.randint(1, 3),
+                "total_amount": "100.00",
+            },
+        )
+
+    def create_order(self):
+        if not self.csrf_token:
+            self.request("browse", "/orders/")
+        sheet_ids = self.fixtures["sheet_ids"]
+        if not sheet_ids:
+            return self.create_receipt()
+        self.request(
+            "create_order",
+            "/orders/",
+            {
+                "csrfmiddlewaretoken": self.csrf_token,
+                "action": "create_order",
+                "client": self.fixtures["client_id"],
+                "warehouse_sheet": random.choice(sheet_ids),
+                "width_mm": random.randint(200, 900),
+                "height_mm": random.randint(200, 900),
+                "price_per_m2": "150.00",
+                "waste_percent": "10",
+                "status": random.choice(["draft", "started", "started"]),
+                "note": "loadtest",
+            },
+        )
+
+    def run(self, deadline):
+        scenarios = list(SCENARIO_WEIGHTS)
+        weights = list(SCENARIO_WEIGHTS.values())
+        while time.monotonic() < deadline:
+            getattr(self, random.choices(scenarios, weights)[0])()
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock_errors = defaultdict(int)
+
+    def record(self, operation, status, elapsed, content):
+        with self.lock:
+            self.latencies[operation].append(elapsed)
+            self.statuses[operation][status] += 1
+            if status >= 500 and any(marker in content for marker in LOCK_MARKERS):
+                self.lock_errors[operation] += 1
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Нагрузочный тест: параллельные клиенты просматривают разделы, создают приходы и заказы."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=20, help="Количество параллельных клиентов.")
+        parser.add_argument("--duration", type=int, default=30, help="Длительность теста в секундах.")
+        parser.add_argument("--port", type=int, default=8765, help="Порт для локального запуска runserver.")
+        parser.add_argument("--url", help="Адрес уже запущенного приложения. Без него запускается runserver.")
+        parser.add_argument(
+            "--use-live-db",
+            action="store_true",
+            help="Писать тестовые данные в рабочую базу. Без флага runserver запускается на временной копии базы.",
+        )
+
+    def handle(self, *args, **options):
+        if options["url"] and not options["use_live_db"]:
+            raise CommandError(
+                "С --url нагрузка и тестовые данные попадут в базу запущенного приложения. "
+                "Подтвердите это флагом --use-live-db."
+            )
+        live_name = connection.settings_dict["NAME"]
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            database_name = None if options["use_live_db"] else self._copy_database(scratch_dir)
+            try:
+                self._run(options, database_name)
+            finally:
+                connection.close()
+                connection.settings_dict["NAME"] = live_name
+
+    def _run(self, options, database_name):
+        fixtures = self._seed()
+        server = None
+        base_url = options["url"]
+        if not base_url:
+            base_url = f"http://127.0.0.1:{options['port']}"
+            server = self._start_server(options["port"], database_name)
+
+        stats = Stats()
+        try:
+            self.stdout.write(f"Нагрузка: {options['clients']} клиентов, {options['duration']} с, {base_url}")
+            started = time.monotonic()
+            deadline = started + options["duration"]
+            with ThreadPoolExecutor(max_workers=options["clients"]) as executor:
+                futures = [
+                    executor.submit(LoadClient(base_url, fixtures, stats).run, deadline)
+                    for _ in range(options["clients"])
+                ]
+                while time.monotonic() < deadline:
+                    time.sleep(1)
+                    fixtures["sheet_ids"] = self._sheet_ids()
+            elapsed = time.monotonic() - started
+            crashed = [future.exception() for future in futures if future.exception() is not None]
+        finally:
+            if server:
+                server.terminate()
+                server.wait(timeout=10)
+
+        self._report(stats, elapsed)
+        for error in crashed:
+            self.stdout.write(self.style.ERROR(f"Клиент остановился с ошибкой: {error!r}"))
+        if crashed:
+            raise CommandError(f"Остановилось клиентов: {len(crashed)} из {options['clients']}.")
+        if not self._check_invariants():
+            raise CommandError("Нарушены инварианты склада.")
+
+    def _seed(self):
+        categories = [GlassCategory.objects.get_or_create(name=f"Нагрузка {index}")[0] for index in range(1, 4)]
+        supplier, _ = Partner.objects.get_or_create(partner_type=Partner.SUPPLIER, name="Нагрузочный поставщик")
+        client, _ = Partner.objects.get_or_create(partner_type=Partner.CLIENT, name="Нагрузочный клиент")
+        return {
+            "category_ids": [category.pk for category in categories],
+            "supplier_id": supplier.pk,
+            "client_id": client.pk,
+            "sheet_ids": self._sheet_ids(),
+        }
+
+    @staticmethod
+    def _sheet_ids():
+        return list(
+            WarehouseSheet.objects.filter(remaining_volume_m2__gt=Decimal("0.5"))
+            .order_by("-pk")
+            .values_list("pk", flat=True)[:50]
+        )
+
+    def _copy_database(self, scratch_dir):
+        if connection.vendor != "sqlite":
+            raise CommandError("Временная копия поддерживается только для SQLite. Используйте --use-live-db.")
+        database_name = os.path.join(scratch_dir, "loadtest.sqlite3")
+        source = sqlite3.connect(connection.settings_dict["NAME"])
+        target = sqlite3.connect(database_name)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        connection.close()
+        connection.settings_dict["NAME"] = database_name
+        self.stdout.write(f"Временная копия базы: {database_name}")
+        return database_name
+
+    def _start_server(self, port, database_name):
+        env = dict(os.environ)
+        if database_name:
+            env["GLASS_DATABASE_NAME"] = database_name
+        server = subprocess.Popen(
+            [sys.executable, str(settings.BASE_DIR / "manage.py"), "runserver", f"127.0.0.1:{port}", "--noreload"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=env,
+        )
+        for _ in range(100):
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                    return server
+            except OSError:
+                if server.poll() is not None:
+                    break
+                time.sleep(0.1)
+        server.terminate()
+        raise CommandError(f"Не удалось запустить сервер на порту {port}.")
+
+    def _report(self, stats, elapsed):
+        total_requests = sum(len(values) for values in stats.latencies.values())
+        self.stdout.write(f"Запросов: {total_requests} за {elapsed:.1f} с ({total_requests / elapsed:.1f} запр/с)")
+        for operation, latencies in sorted(stats.latencies.items()):
+            statuses = stats.statuses[operation]
+            # A write answered with 200 is the form page with validation errors.
+            success_statuses = (302,) if operation in WRITE_OPERATIONS else (200, 302, 304)
+            succeeded = sum(count for status, count in statuses.items() if status in success_statuses)
+            rejected = ""
+            if operation in WRITE_OPERATIONS:
+                rejected = f"отклонено формой {statuses.get(200, 0) / len(latencies):.1%}, "
+            errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+            self.stdout.write(
+                f"  {operation}: {len(latencies)} запр., {succeeded / elapsed * 60:.0f}/мин, "
+                f"{rejected}"
+                f"p50 {percentile(latencies, 0.5) * 1000:.0f} мс, "
+                f"p95 {percentile(latencies, 0.95) * 1000:.0f} мс, "
+                f"p99 {percentile(latencies, 0.99) * 1000:.0f} мс, "
+                f"ошибок {errors / len(latencies):.1%}, блокировок {stats.lock_errors[operation] / len(latencies):.1%}, "
+                f"статусы {dict(sorted(statuses.items()))}"
+            )
+
+    def _check_invariants(self):
+        ok = True
+        negative = WarehouseSheet.objects.filter(remaining_volume_m2__lt=0).count()
+        if negative:
+            ok = False
+            self.stdout.write(self.style.ERROR(f"Листов с отрицательным остатком: {negative}"))
+
+        expected = aggregate_warehouse_balances()
+        stored = {
+            (location_id, glass_type_id): (total_sheets, total_volume)
+            for location_id, glass_type_id, total_sheets, total_volume in WarehouseBalance.objects.values_list(
+                "location_id", "glass_type_id", "total_sheets", "total_volume_m2"
+            )
+        }
+        empty = (0, Decimal("0.000"))
+        drifted = 0
+        for key in set(expected) | set(stored):
+            if expected.get(key, empty) != stored.get(key, empty):
+                drifted += 1
+        if drifted:
+            ok = False
+            self.stdout.write(self.style.ERROR(f"Остатков, не совпадающих с листами: {drifted}"))
+
+        if ok:
+            self.stdout.write(self.style.SUCCESS("Инварианты склада соблюдены."))
+        return ok
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from frontend import search
+
+
+class Command(BaseCommand):
+    help = "Пересобрать поисковый индекс контрагентов, кодов продукта и видов стекла."
+
+    def handle(self, *args, **options):
+        if not search.ensure_search_index():
+            self.stdout.write(self.style.WARNING("FTS5 недоступен, поиск работает через запросы к таблицам."))
+            return
+        count = search.rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано записей: {count}"))
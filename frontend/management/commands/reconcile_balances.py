@@ -0,0 +1,116 @@
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from frontend.models import GlassType, WarehouseBalance, aggregate_warehouse_balances
+
+
+def _init_worker():
+    connections.close_all()
+
+
+def _aggregate_chunk(glass_type_ids):
+    return aggregate_warehouse_balances(glass_type_ids)
+
+
+class Command(BaseCommand):
+    help = "Пересчитать остатки склада по листам, показать расхождения и исправить их."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Только показать расхождения, ничего не сохранять.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Количество процессов для пересчета. При 1 используется один агрегирующий запрос.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500, help="Видов стекла в одной порции при --workers > 1.")
+
+    def handle(self, *args, **options):
+        expected = self._compute(options["workers"], options["chunk_size"])
+        stored = {(balance.location_id, balance.glass_type_id): balance for balance in WarehouseBalance.objects.all()}
+
+        drifted = []
+        for key in sorted(set(expected) | set(stored)):
+            total_sheets, total_volume = expected.get(key, (0, Decimal("0.000")))
+            balance = stored.get(key)
+            if balance is None:
+                if not total_sheets:
+                    continue
+                self._report(key, None, None, total_sheets, total_volume)
+                drifted.append((key, None))
+            elif balance.total_sheets != total_sheets or balance.total_volume_m2 != total_volume:
+                self._report(key, balance.total_sheets, balance.total_volume_m2, total_sheets, total_volume)
+                drifted.append((key, balance))
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Расхождений нет."))
+            return
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"Найдено расхождений: {len(drifted)} (dry-run, изменения не сохранены)."))
+            return
+
+        fixed, skipped = self._apply(drifted)
+        self.stdout.write(self.style.SUCCESS(f"Исправлено остатков: {fixed}."))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Пропущено остатков, измененных во время проверки: {skipped}."))
+
+    def _apply(self, drifted):
+        # Orders and receipts keep writing balances while the check runs: recount
+        # the drifted keys inside the write transaction and only overwrite a row
+        # that still holds the value read above.
+        fixed = skipped = 0
+        now = timezone.now()
+        with transaction.atomic():
+            fresh = aggregate_warehouse_balances({glass_type_id for (_, glass_type_id), _ in drifted})
+            for key, balance in drifted:
+                total_sheets, total_volume = fresh.get(key, (0, Decimal("0.000")))
+                location_id, glass_type_id = key
+                if balance is None:
+                    if not total_sheets:
+                        skipped += 1
+                        continue
+                    _, created = WarehouseBalance.objects.get_or_create(
+                        location_id=location_id,
+                        glass_type_id=glass_type_id,
+                        defaults={"total_sheets": total_sheets, "total_volume_m2": total_volume},
+                    )
+                    updated = int(created)
+                elif balance.total_sheets == total_sheets and balance.total_volume_m2 == total_volume:
+                    updated = 0
+                else:
+                    updated = WarehouseBalance.objects.filter(
+                        pk=balance.pk,
+                        total_sheets=balance.total_sheets,
+                        total_volume_m2=balance.total_volume_m2,
+                    ).update(total_sheets=total_sheets, total_volume_m2=total_volume, updated_at=now)
+                if updated:
+                    fixed += 1
+                else:
+                    skipped += 1
+        return fixed, skipped
+
+    def _compute(self, workers, chunk_size):
+        if workers <= 1:
+            return aggregate_warehouse_balances()
+
+        glass_type_ids = list(GlassType.objects.order_by("pk").values_list("pk", flat=True))
+        chunks = [glass_type_ids[start : start + chunk_size] for start in range(0, len(glass_type_ids), chunk_size)]
+        connections.close_all()
+
+        expected = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            for chunk_result in executor.map(_aggregate_chunk, chunks):
+                expected.update(chunk_result)
+        return expected
+
+    def _report(self, key, stored_sheets, stored_volume, total_sheets, total_volume):
+        location_id, glass_type_id = key
+        self.stdout.write(
+            f"Склад #{location_id}, вид стекла #{glass_type_id}: листов {stored_sheets if stored_sheets is not None else '—'} → {total_sheets}, "
+            f"объем {stored_volume if stored_volume is not None else '—'} → {total_volume} м²"
+        )
@@ -2,11 +2,47 @@ from decimal import Decimal
 
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Sum
 from django.db.models.functions import Coalesce
 
 
+class Location(models.Model):
+    DEFAULT_NAME = "Основной склад"
+
+    name = models.CharField("Склад", max_length=255, unique=True)
+    address = models.CharField("Адрес", max_length=255, blank=True)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name = "Склад"
+        verbose_name_plural = "Склады"
+
+    def __str__(self):
+        return self.name
+
+
+def default_location():
+    location = Location.objects.order_by("pk").first()
+    if location is None:
+        location = Location.objects.get_or_create(name=Location.DEFAULT_NAME)[0]
+    return location
+
+
+class ClientGroup(models.Model):
+    name = models.CharField("Группа клиентов", max_length=255, unique=True)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name = "Группа клиентов"
+        verbose_name_plural = "Группы клиентов"
+
+    def __str__(self):
+        return self.name
+
+
 class Partner(models.Model):
     CLIENT = "client"
     SUPPLIER = "supplier"
@@ -19,11 +55,20 @@ class Partner(models.Model):
     name = models.CharField("Название", max_length=255)
     phone = models.CharField("Телефон", max_length=50, blank=True)
     address = models.CharField("Адрес", max_length=255, blank=True)
+    client_group = models.ForeignKey(
+        ClientGroup,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="partners",
+        verbose_name="Группа клиентов",
+    )
     note = models.TextField("Примечание", blank=True)
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True, db_index=True)
 
     class Meta:
-        indexes = [models.Index(fields=["partner_type", "name"])]
+        indexes = [models.Index(fields=["partner_type", "name"]), models.Index(fields=["-created_at"])]
         verbose_name = "Партнер"
         verbose_name_plural = "Партнеры"
 
@@ -33,6 +78,7 @@ class Partner(models.Model):
 
 class GlassCategory(models.Model):
     name = models.CharField("Категория стекла", max_length=255, unique=True)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["name"]
@@ -51,6 +97,7 @@ class GlassType(models.Model):
         verbose_name="Категория",
     )
     name = models.CharField("Вид стекла", max_length=255)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["category__name", "name"]
@@ -62,7 +109,76 @@ class GlassType(models.Model):
         return f"{self.category.name} / {self.name}"
 
 
+class PriceList(models.Model):
+    name = models.CharField("Прайс-лист", max_length=255)
+    client_group = models.ForeignKey(
+        ClientGroup,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="price_lists",
+        verbose_name="Группа клиентов",
+        help_text="Пусто — прайс-лист для всех клиентов.",
+    )
+    is_active = models.BooleanField("Активен", default=True)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name = "Прайс-лист"
+        verbose_name_plural = "Прайс-листы"
+
+    def __str__(self):
+        return self.name
+
+
+class PriceRule(models.Model):
+    price_list = models.ForeignKey(PriceList, on_delete=models.CASCADE, related_name="rules", verbose_name="Прайс-лист")
+    glass_type = models.ForeignKey(
+        GlassType,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="price_rules",
+        verbose_name="Вид стекла",
+        help_text="Пусто — правило для всех видов стекла.",
+    )
+    min_thickness_mm = models.DecimalField("Толщина от (мм)", max_digits=6, decimal_places=2, default=Decimal("0.00"))
+    max_thickness_mm = models.DecimalField("Толщина до (мм)", max_digits=6, decimal_places=2, null=True, blank=True)
+    min_volume_m2 = models.DecimalField(
+        "Объем от (м²)",
+        max_digits=12,
+        decimal_places=3,
+        default=Decimal("0.000"),
+        validators=[MinValueValidator(Decimal("0.000"))],
+    )
+    price_per_m2 = models.DecimalField(
+        "Цена за м²",
+        max_digits=12,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal("0.00"))],
+    )
+
+    class Meta:
+        ordering = ["price_list", "glass_type", "min_thickness_mm", "min_volume_m2"]
+        verbose_name = "Правило цены"
+        verbose_name_plural = "Правила цен"
+
+    def clean(self):
+        if self.max_thickness_mm is not None and self.max_thickness_mm < self.min_thickness_mm:
+            raise ValidationError({"max_thickness_mm": "Верхняя граница толщины меньше нижней."})
+
+    def __str__(self):
+        return f"{self.price_list}: {self.glass_type or 'все виды'} — {self.price_per_m2}"
+
+
 class WarehouseReceipt(models.Model):
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.PROTECT,
+        related_name="receipts",
+        verbose_name="Склад",
+    )
     glass_type = models.ForeignKey(
         GlassType,
         on_delete=models.PROTECT,
@@ -94,9 +210,15 @@ class WarehouseReceipt(models.Model):
         validators=[MinValueValidator(Decimal("0.00"))],
     )
     created_at = models.DateTimeField("Дата прихода", auto_now_add=True)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["location", "-created_at"]),
+            models.Index(fields=["location", "glass_type", "width_mm", "height_mm"]),
+            models.Index(fields=["location", "glass_type", "product_code"]),
+        ]
         verbose_name = "Приход на склад"
         verbose_name_plural = "Приходы на склад"
 
@@ -110,6 +232,8 @@ class WarehouseReceipt(models.Model):
         )
 
     def save(self, *args, **kwargs):
+        if self.location_id is None:
+            self.location = default_location()
         width_m = Decimal(self.width_mm) / Decimal("1000")
         height_m = Decimal(self.height_mm) / Decimal("1000")
         self.total_volume_m2 = (width_m * height_m * Decimal(self.quantity)).quantize(Decimal("0.001"))
@@ -120,6 +244,7 @@ class WarehouseReceipt(models.Model):
                 [
                     WarehouseSheet(
                         receipt=self,
+                        location=self.location,
                         glass_type=self.glass_type,
                         product_code=self.product_code,
                         width_mm=self.width_mm,
@@ -130,11 +255,17 @@ class WarehouseReceipt(models.Model):
                     for _ in range(self.quantity)
                 ]
             )
-        update_warehouse_balance(self.glass_type)
+        update_warehouse_balance(self.glass_type, self.location)
 
 
 class WarehouseSheet(models.Model):
     receipt = models.ForeignKey(WarehouseReceipt, on_delete=models.CASCADE, related_name="sheets")
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.PROTECT,
+        related_name="sheets",
+        verbose_name="Склад",
+    )
     glass_type = models.ForeignKey(GlassType, on_delete=models.PROTECT, related_name="warehouse_sheets")
     product_code = models.CharField("Код продукта", max_length=100)
     width_mm = models.PositiveIntegerField("Ширина (мм)")
@@ -142,9 +273,15 @@ class WarehouseSheet(models.Model):
     thickness_mm = models.DecimalField("Толщина (мм)", max_digits=6, decimal_places=2)
     remaining_volume_m2 = models.DecimalField("Остаток объема (м²)", max_digits=12, decimal_places=3)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["location", "glass_type", "remaining_volume_m2"]),
+            models.Index(fields=["location", "-created_at"]),
+            models.Index(fields=["location", "updated_at"]),
+        ]
         verbose_name = "Лист на складе"
         verbose_name_plural = "Листы на складе"
 
@@ -158,6 +295,9 @@ class WarehouseSheet(models.Model):
     def size_display(self):
         return f"{self.width_mm}×{self.height_mm} мм"
 
+    def has_open_orders(self):
+        return self.orders.exclude(status=Order.STATUS_CANCELLED).exists()
+
     def __str__(self):
         return f"{self.glass_type} / {self.product_code} / {self.size_display}"
 
@@ -176,6 +316,13 @@ class Order(models.Model):
         (STATUS_CANCELLED, "Отменено"),
     ]
 
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.PROTECT,
+        editable=False,
+        related_name="orders",
+        verbose_name="Склад",
+    )
     client = models.ForeignKey(Partner, on_delete=models.PROTECT, related_name="orders", verbose_name="Клиент")
     warehouse_sheet = models.ForeignKey(
         WarehouseSheet,
@@ -202,9 +349,11 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_DRAFT)
     note = models.TextField("Комментарий", blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["location", "-created_at"])]
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
 
@@ -233,6 +382,10 @@ class Order(models.Model):
                 raise ValidationError("Недостаточно остатка на выбранном листе для запуска заказа.")
 
     def save(self, *args, **kwargs):
+        # Book the order where the sheet is when it is cut, not where it was
+        # when the draft was created.
+        if not self.is_consumed:
+            self.location_id = self.warehouse_sheet.location_id
         self.thickness_mm = self.warehouse_sheet.thickness_mm
         order_volume = ((Decimal(self.width_mm) / Decimal("1000")) * (Decimal(self.height_mm) / Decimal("1000"))).quantize(
             Decimal("0.001")
@@ -250,57 +403,173 @@ class Order(models.Model):
             self.warehouse_sheet.remaining_volume_m2 = (
                 self.warehouse_sheet.remaining_volume_m2 - self.consumed_volume_m2
             ).quantize(Decimal("0.001"))
-            self.warehouse_sheet.save(update_fields=["remaining_volume_m2"])
+            self.warehouse_sheet.save(update_fields=["remaining_volume_m2", "updated_at"])
             WasteRecord.objects.get_or_create(
                 order=self,
                 defaults={
+                    "location_id": self.location_id,
                     "warehouse_sheet": self.warehouse_sheet,
                     "waste_volume_m2": self.waste_volume_m2,
                     "waste_amount": (self.waste_volume_m2 * self.price_per_m2).quantize(Decimal("0.01")),
                 },
             )
             self.is_consumed = True
-            super().save(update_fields=["is_consumed"])
-            update_warehouse_balance(self.warehouse_sheet.glass_type)
+            super().save(update_fields=["is_consumed", "updated_at"])
+            update_warehouse_balance(self.warehouse_sheet.glass_type, self.warehouse_sheet.location)
 
 
 class WasteRecord(models.Model):
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.PROTECT,
+        related_name="waste_records",
+        verbose_name="Склад",
+    )
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name="waste_record")
     warehouse_sheet = models.ForeignKey(WarehouseSheet, on_delete=models.CASCADE, related_name="waste_records")
     waste_volume_m2 = models.DecimalField("Объем отхода (м²)", max_digits=12, decimal_places=3)
     waste_amount = models.DecimalField("Сумма отхода", max_digits=12, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["location", "-created_at"])]
         verbose_name = "Отход"
         verbose_name_plural = "Отходы"
 
 
+class StockTransfer(models.Model):
+    warehouse_sheet = models.ForeignKey(
+        WarehouseSheet,
+        on_delete=models.CASCADE,
+        related_name="transfers",
+        verbose_name="Лист стекла",
+    )
+    from_location = models.ForeignKey(
+        Location,
+        on_delete=models.PROTECT,
+        editable=False,
+        related_name="outgoing_transfers",
+        verbose_name="Со склада",
+    )
+    to_location = models.ForeignKey(
+        Location,
+        on_delete=models.PROTECT,
+        related_name="incoming_transfers",
+        verbose_name="На склад",
+    )
+    note = models.TextField("Комментарий", blank=True)
+    created_at = models.DateTimeField("Дата перемещения", auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["from_location", "created_at"]),
+            models.Index(fields=["to_location", "-created_at"]),
+        ]
+        verbose_name = "Перемещение листа"
+        verbose_name_plural = "Перемещения листов"
+
+    def clean(self):
+        if self.from_location_id == self.to_location_id:
+            raise ValidationError("Лист уже находится на выбранном складе.")
+        if self.pk is None and self.warehouse_sheet_id and self.warehouse_sheet.has_open_orders():
+            raise ValidationError("По листу есть заказы, его нельзя переместить на другой склад.")
+
+    def save(self, *args, **kwargs):
+        is_new = self.pk is None
+        if is_new:
+            self.from_location = self.warehouse_sheet.location
+        self.full_clean()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                self.warehouse_sheet.location = self.to_location
+                self.warehouse_sheet.save(update_fields=["location", "updated_at"])
+                update_warehouse_balance(self.warehouse_sheet.glass_type, self.from_location)
+                update_warehouse_balance(self.warehouse_sheet.glass_type, self.to_location)
+
+    def __str__(self):
+        return f"{self.warehouse_sheet}: {self.from_location} → {self.to_location}"
+
+
 class WarehouseBalance(models.Model):
-    glass_type = models.OneToOneField(
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.CASCADE,
+        related_name="warehouse_balances",
+        verbose_name="Склад",
+    )
+    glass_type = models.ForeignKey(
         GlassType,
         on_delete=models.CASCADE,
-        related_name="warehouse_balance",
+        related_name="warehouse_balances",
         verbose_name="Вид стекла",
     )
     total_sheets = models.PositiveIntegerField("Общее количество листов", default=0)
     total_volume_m2 = models.DecimalField("Общий объем (м²)", max_digits=12, decimal_places=3, default=Decimal("0.000"))
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True, db_index=True)
 
     class Meta:
+        unique_together = ("location", "glass_type")
         verbose_name = "Остаток на складе"
         verbose_name_plural = "Остатки на складе"
 
     def __str__(self):
-        return f"{self.glass_type}: {self.total_sheets} шт., {self.total_volume_m2} м²"
+        return f"{self.location} / {self.glass_type}: {self.total_sheets} шт., {self.total_volume_m2} м²"
 
 
-def update_warehouse_balance(glass_type):
-    aggregated = WarehouseSheet.objects.filter(glass_type=glass_type, remaining_volume_m2__gt=0).aggregate(
+class DeletedSheet(models.Model):
+    sheet_id = models.PositiveBigIntegerField("Лист")
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name="deleted_sheets", verbose_name="Склад")
+    deleted_at = models.DateTimeField("Дата удаления", auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["location", "deleted_at"])]
+        verbose_name = "Удаленный лист"
+        verbose_name_plural = "Удаленные листы"
+
+
+class DeletionCounter(models.Model):
+    table = models.CharField("Таблица", max_length=100, primary_key=True)
+    deletions = models.PositiveBigIntegerField("Удалено строк", default=0)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True)
+
+    class Meta:
+        verbose_name = "Счетчик удалений"
+        verbose_name_plural = "Счетчики удалений"
+
+    def __str__(self):
+        return f"{self.table}: {self.deletions}"
+
+
+def update_warehouse_balance(glass_type, location):
+    aggregated = WarehouseSheet.objects.filter(
+        location=location, glass_type=glass_type, remaining_volume_m2__gt=0
+    ).aggregate(
         total_sheets=Coalesce(models.Count("id"), 0),
         total_volume=Coalesce(Sum("remaining_volume_m2"), Decimal("0.000")),
     )
     WarehouseBalance.objects.update_or_create(
+        location=location,
         glass_type=glass_type,
         defaults={"total_sheets": aggregated["total_sheets"], "total_volume_m2": aggregated["total_volume"]},
-    )
\ No newline at end of file
+    )
+
+
+def aggregate_warehouse_balances(glass_type_ids=None):
+    sheets = WarehouseSheet.objects.filter(remaining_volume_m2__gt=0)
+    if glass_type_ids is not None:
+        sheets = sheets.filter(glass_type_id__in=glass_type_ids)
+    rows = sheets.values("location_id", "glass_type_id").annotate(
+        total_sheets=models.Count("id"),
+        total_volume=Sum("remaining_volume_m2"),
+    )
+    return {
+        (row["location_id"], row["glass_type_id"]): (
+            row["total_sheets"],
+            Decimal(row["total_volume"]).quantize(Decimal("0.001")),
+        )
+        for row in rows.order_by()
+    }
@@ -0,0 +1,76 @@
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
+from .models import PriceRule
+
+# Other worker processes only learn about rule changes through the TTL.
+CACHE_TTL_SECONDS = 60
+
+_lock = threading.Lock()
+_compiled = None
+_compiled_at = 0.0
+
+
+def invalidate():
+    global _compiled
+    with _lock:
+        _compiled = None
+
+
+def _compile():
+    bands = defaultdict(lambda: defaultdict(list))
+    rules = PriceRule.objects.filter(price_list__is_active=True).values_list(
+        "price_list__client_group_id",
+        "glass_type_id",
+        "min_thickness_mm",
+        "max_thickness_mm",
+        "min_volume_m2",
+        "price_per_m2",
+    ).order_by()
+    for client_group_id, glass_type_id, min_thickness, max_thickness, min_volume, price in rules:
+        bands[(client_group_id, glass_type_id)][(min_thickness, max_thickness)].append((min_volume, price))
+
+    compiled = {}
+    for key, key_bands in bands.items():
+        compiled[key] = []
+        # Narrowest band first: higher lower bound, then lower upper bound, open-ended last.
+        ordered_bands = sorted(
+            key_bands.items(),
+            key=lambda item: (-item[0][0], item[0][1] is None, item[0][1] or 0),
+        )
+        for (min_thickness, max_thickness), tiers in ordered_bands:
+            tiers.sort()
+            compiled[key].append(
+                (min_thickness, max_thickness, [volume for volume, _ in tiers], [price for _, price in tiers])
+            )
+    return compiled
+
+
+def get_compiled():
+    global _compiled, _compiled_at
+    with _lock:
+        if _compiled is None or time.monotonic() - _compiled_at > CACHE_TTL_SECONDS:
+            _compiled = _compile()
+            _compiled_at = time.monotonic()
+        return _compiled
+
+
+def resolve_price(glass_type_id, thickness_mm, client_group_id=None, volume_m2=Decimal("0.000")):
+    compiled = get_compiled()
+    thickness_mm = Decimal(thickness_mm)
+    volume_m2 = Decimal(volume_m2)
+    keys = [(None, glass_type_id), (None, None)]
+    if client_group_id is not None:
+        keys = [(client_group_id, glass_type_id), (client_group_id, None)] + keys
+
+    for key in keys:
+        for min_thickness, max_thickness, volumes, prices in compiled.get(key, ()):
+            if thickness_mm < min_thickness or (max_thickness is not None and thickness_mm > max_thickness):
+                continue
+            tier = bisect_right(volumes, volume_m2) - 1
+            if tier >= 0:
+                return prices[tier]
+    return None
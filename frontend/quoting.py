@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+# Every quantity is kept as an exact integer in its rounding unit: areas in
+# thousandths of m² (0.001), money in cents, waste percent in hundredths. Integer
+# division with half-even rounding reproduces Decimal.quantize() in Order.save().
+
+class QuoteError(ValueError):
+    pass
+
+
+def _round_div(numerator, denominator):
+    quotient, remainder = divmod(numerator, denominator)
+    if remainder * 2 > denominator or (remainder * 2 == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def _to_units(value, places):
+    return int(Decimal(value).scaleb(places).to_integral_exact())
+
+
+def area_units(width_mm, height_mm):
+    return _round_div(width_mm * height_mm, 1000)
+
+
+def quote_batch(items, sheet_width_mm, sheet_height_mm, price_per_m2, waste_percent):
+    price_cents = _to_units(price_per_m2, 2)
+    waste_hundredths = _to_units(waste_percent, 2)
+    sheet_units = area_units(sheet_width_mm, sheet_height_mm)
+
+    lines = []
+    total_quantity = 0
+    total_order_units = 0
+    total_waste_units = 0
+    total_cents = 0
+    for width_mm, height_mm, quantity in items:
+        fits = (width_mm <= sheet_width_mm and height_mm <= sheet_height_mm) or (
+            width_mm <= sheet_height_mm and height_mm <= sheet_width_mm
+        )
+        order_units = area_units(width_mm, height_mm)
+        leftover_units = max(sheet_units - order_units, 0)
+        waste_units = _round_div(leftover_units * waste_hundredths, 10000)
+        unit_cents = _round_div((order_units + waste_units) * price_cents, 1000)
+
+        lines.append(
+            {
+                "width_mm": width_mm,
+                "height_mm": height_mm,
+                "quantity": quantity,
+                "fits": fits,
+                "order_volume_m2": Decimal(order_units).scaleb(-3),
+                "waste_volume_m2": Decimal(waste_units).scaleb(-3),
+                "unit_amount": Decimal(unit_cents).scaleb(-2),
+                "total_amount": Decimal(unit_cents * quantity).scaleb(-2),
+            }
+        )
+        total_quantity += quantity
+        total_order_units += order_units * quantity
+        total_waste_units += waste_units * quantity
+        total_cents += unit_cents * quantity
+
+    return {
+        "lines": lines,
+        "total_quantity": total_quantity,
+        "order_volume_m2": Decimal(total_order_units).scaleb(-3),
+        "waste_volume_m2": Decimal(total_waste_units).scaleb(-3),
+        "total_amount": Decimal(total_cents).scaleb(-2),
+    }
@@ -0,0 +1,224 @@
+import re
+
+from django.db import OperationalError, connection
+from django.db.models import Min, Q
+from django.db.models.expressions import RawSQL
+
+from .models import GlassType, Partner, WarehouseReceipt
+
+INDEX_TABLE = "frontend_search_index"
+
+KIND_PARTNER = "partner"
+KIND_PRODUCT_CODE = "product_code"
+KIND_GLASS_TYPE = "glass_type"
+
+# rowid = pk * ROWID_STRIDE + kind code, so one indexed object is updated or
+# removed by rowid without scanning the FTS table.
+ROWID_STRIDE = 8
+KIND_CODES = {
+    KIND_PARTNER: 1,
+    KIND_PRODUCT_CODE: 2,
+    KIND_GLASS_TYPE: 3,
+}
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_index_available = None
+
+
+def _rowid(kind, pk):
+    return pk * ROWID_STRIDE + KIND_CODES[kind]
+
+
+def _document(kind, instance):
+    if kind == KIND_PARTNER:
+        return instance.partner_type, " ".join(filter(None, [instance.name, instance.phone, instance.address]))
+    if kind == KIND_PRODUCT_CODE:
+        return str(instance.glass_type_id), instance.product_code
+    return str(instance.category_id), f"{instance.category.name} {instance.name}"
+
+
+def _querysets():
+    return {
+        KIND_PARTNER: Partner.objects.all(),
+        KIND_PRODUCT_CODE: WarehouseReceipt.objects.select_related("glass_type", "glass_type__category"),
+        KIND_GLASS_TYPE: GlassType.objects.select_related("category"),
+    }
+
+
+def is_available():
+    global _index_available
+    if _index_available is None:
+        _index_available = connection.vendor == "sqlite" and INDEX_TABLE in connection.introspection.table_names()
+    return _index_available
+
+
+def ensure_search_index():
+    global _index_available
+    if connection.vendor != "sqlite":
+        _index_available = False
+        return False
+
+    if INDEX_TABLE not in connection.introspection.table_names():
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {INDEX_TABLE} USING fts5("
+                    "kind UNINDEXED, scope UNINDEXED, content, "
+                    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+                )
+        except OperationalError:
+            _index_available = False
+            return False
+        _index_available = True
+        rebuild_search_index()
+
+    _index_available = True
+    return True
+
+
+def rebuild_search_index():
+    if not is_available():
+        return 0
+
+    rows = []
+    for kind, queryset in _querysets().items():
+        for instance in queryset.iterator():
+            scope, content = _document(kind, instance)
+            rows.append((_rowid(kind, instance.pk), kind, scope, content))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+        cursor.executemany(f"INSERT INTO {INDEX_TABLE} (rowid, kind, scope, content) VALUES (%s, %s, %s, %s)", rows)
+    return len(rows)
+
+
+def index_object(kind, instance):
+    if not is_available():
+        return
+    scope, content = _document(kind, instance)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {INDEX_TABLE} (rowid, kind, scope, content) VALUES (%s, %s, %s, %s)",
+            [_rowid(kind, instance.pk), kind, scope, content],
+        )
+
+
+def unindex_object(kind, pk):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE rowid = %s", [_rowid(kind, pk)])
+
+
+def _match_expression(query):
+    tokens = TOKEN_RE.findall(query)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _fallback_filter(kind, query):
+    if kind == KIND_PARTNER:
+        return Q(name__istartswith=query) | Q(phone__startswith=query)
+    if kind == KIND_PRODUCT_CODE:
+        return Q(product_code__istartswith=query)
+    return Q(name__istartswith=query) | Q(category__name__istartswith=query)
+
+
+def _match_sql(kind, query, scope, select="rowid"):
+    expression = _match_expression(query)
+    if not expression:
+        return None, None
+    sql = f"SELECT {select} FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s AND kind = %s"
+    params = [expression, kind]
+    if scope is not None:
+        sql += " AND scope = %s"
+        params.append(str(scope))
+    return sql, params
+
+
+def search_subquery(kind, query, scope=None):
+    sql, params = _match_sql(kind, query.strip(), scope, select=f"rowid / {ROWID_STRIDE}")
+    if sql is None:
+        return None
+    return RawSQL(sql, params)
+
+
+def _distinct_code_ids(query, scope, limit):
+    # Receipts repeat product codes: read matches in rank order and keep the
+    # first receipt per (glass type, code) until the limit is reached, so
+    # duplicates cannot crowd out other codes.
+    sql, params = _match_sql(KIND_PRODUCT_CODE, query, scope, select="rowid, scope, content")
+    if sql is None:
+        return []
+    ids = []
+    seen = set()
+    with connection.cursor() as cursor:
+        cursor.execute(sql + " ORDER BY rank", params)
+        while len(ids) < limit:
+            rows = cursor.fetchmany(limit)
+            if not rows:
+                break
+            for rowid, glass_type_id, product_code in rows:
+                if (glass_type_id, product_code) not in seen and len(ids) < limit:
+                    seen.add((glass_type_id, product_code))
+                    ids.append(rowid // ROWID_STRIDE)
+    return ids
+
+
+def search_ids(kind, query, scope=None, limit=20):
+    query = query.strip()
+    if not query:
+        return []
+
+    if is_available():
+        if kind == KIND_PRODUCT_CODE:
+            return _distinct_code_ids(query, scope, limit)
+        sql, params = _match_sql(kind, query, scope)
+        if sql is None:
+            return []
+        sql += " ORDER BY rank LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [rowid // ROWID_STRIDE for (rowid,) in cursor.fetchall()]
+
+    queryset = _querysets()[kind].filter(_fallback_filter(kind, query))
+    if scope is not None:
+        scope_field = {KIND_PARTNER: "partner_type", KIND_PRODUCT_CODE: "glass_type_id", KIND_GLASS_TYPE: "category_id"}
+        queryset = queryset.filter(**{scope_field[kind]: scope})
+    if kind == KIND_PRODUCT_CODE:
+        first_ids = (
+            queryset.order_by()
+            .values("glass_type_id", "product_code")
+            .annotate(first_id=Min("pk"))
+            .order_by("product_code", "glass_type_id")
+            .values_list("first_id", flat=True)
+        )
+        return list(first_ids[:limit])
+    return list(queryset.values_list("pk", flat=True)[:limit])
+
+
+def search(kind, query, scope=None, limit=20):
+    ids = search_ids(kind, query, scope=scope, limit=limit)
+    objects = _querysets()[kind].in_bulk(ids)
+
+    results = []
+    for pk in ids:
+        instance = objects.get(pk)
+        if instance is None:
+            continue
+        if kind == KIND_PRODUCT_CODE:
+            results.append(
+                {
+                    "id": instance.pk,
+                    "label": f"{instance.product_code} — {instance.glass_type}",
+                    "product_code": instance.product_code,
+                    "glass_type_id": instance.glass_type_id,
+                }
+            )
+        elif kind == KIND_PARTNER:
+            label = f"{instance.name} ({instance.phone})" if instance.phone else instance.name
+            results.append({"id": instance.pk, "label": label, "partner_type": instance.partner_type})
+        else:
+            results.append({"id": instance.pk, "label": str(instance)})
+    return results
@@ -0,0 +1,123 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import events, pricing, search
+from .models import (
+    ClientGroup,
+    DeletedSheet,
+    DeletionCounter,
+    GlassCategory,
+    GlassType,
+    Order,
+    Partner,
+    PriceList,
+    PriceRule,
+    WarehouseBalance,
+    WarehouseReceipt,
+    WarehouseSheet,
+    update_warehouse_balance,
+)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    if sender.name == "frontend":
+        search.ensure_search_index()
+
+
+@receiver(post_delete)
+def count_deletion(sender, **kwargs):
+    if sender._meta.app_label != "frontend" or sender is DeletionCounter:
+        return
+    table = sender._meta.db_table
+    if not DeletionCounter.objects.filter(table=table).update(deletions=F("deletions") + 1, updated_at=timezone.now()):
+        DeletionCounter.objects.get_or_create(table=table, defaults={"deletions": 1})
+
+
+@receiver(post_delete, sender=WarehouseSheet)
+def record_deleted_sheet(sender, instance, **kwargs):
+    DeletedSheet.objects.create(sheet_id=instance.pk, location_id=instance.location_id)
+
+
+@receiver(post_save, sender=Partner)
+def index_partner(sender, instance, **kwargs):
+    search.index_object(search.KIND_PARTNER, instance)
+
+
+@receiver(post_save, sender=WarehouseReceipt)
+def index_receipt(sender, instance, **kwargs):
+    search.index_object(search.KIND_PRODUCT_CODE, instance)
+
+
+@receiver(post_save, sender=GlassType)
+def index_glass_type(sender, instance, **kwargs):
+    search.index_object(search.KIND_GLASS_TYPE, instance)
+
+
+@receiver(post_save, sender=GlassCategory)
+def reindex_category_glass_types(sender, instance, **kwargs):
+    for glass_type in instance.glass_types.select_related("category"):
+        search.index_object(search.KIND_GLASS_TYPE, glass_type)
+
+
+@receiver(post_delete, sender=Partner)
+def unindex_partner(sender, instance, **kwargs):
+    search.unindex_object(search.KIND_PARTNER, instance.pk)
+
+
+@receiver(post_delete, sender=WarehouseReceipt)
+def unindex_receipt(sender, instance, **kwargs):
+    search.unindex_object(search.KIND_PRODUCT_CODE, instance.pk)
+
+
+@receiver(post_delete, sender=WarehouseReceipt)
+def refresh_balance_after_receipt_delete(sender, instance, **kwargs):
+    # The receipt's sheets are deleted before it, so the recount sees them gone.
+    update_warehouse_balance(instance.glass_type, instance.location)
+
+
+@receiver(post_delete, sender=GlassType)
+def unindex_glass_type(sender, instance, **kwargs):
+    search.unindex_object(search.KIND_GLASS_TYPE, instance.pk)
+
+
+@receiver(post_save, sender=ClientGroup)
+@receiver(post_save, sender=PriceList)
+@receiver(post_save, sender=PriceRule)
+@receiver(post_delete, sender=ClientGroup)
+@receiver(post_delete, sender=PriceList)
+@receiver(post_delete, sender=PriceRule)
+def invalidate_prices(sender, **kwargs):
+    transaction.on_commit(pricing.invalidate)
+
+
+@receiver(post_save, sender=WarehouseBalance)
+def publish_balance(sender, instance, **kwargs):
+    data = {
+        "location_id": instance.location_id,
+        "glass_type_id": instance.glass_type_id,
+        "total_sheets": instance.total_sheets,
+        "total_volume_m2": str(Decimal(instance.total_volume_m2).quantize(Decimal("0.001"))),
+    }
+    transaction.on_commit(lambda: events.publish("balance", data))
+
+
+@receiver(post_save, sender=WarehouseSheet)
+def publish_sheet(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and "remaining_volume_m2" not in update_fields):
+        return
+    data = {"id": instance.pk, "remaining_volume_m2": str(instance.remaining_volume_m2)}
+    transaction.on_commit(lambda: events.publish("sheet", data))
+
+
+@receiver(post_save, sender=Order)
+def publish_order(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "status" not in update_fields:
+        return
+    data = {"id": instance.pk, "status": instance.status, "status_display": instance.get_status_display()}
+    transaction.on_commit(lambda: events.publish("order", data))
@@ -1,3 +1,834 @@
+import json
+import random
+import re
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import analytics, events, inventory, pricing, quoting, search
+from .forms import StockTransferForm
+from .management.commands import loadtest, reconcile_balances
+from .models import (
+    ClientGroup,
+    GlassCategory,
+    GlassType,
+    Location,
+    Order,
+    Partner,
+    PriceList,
+    PriceRule,
+    StockTransfer,
+    WarehouseBalance,
+    WarehouseReceipt,
+    WarehouseSheet,
+    aggregate_warehouse_balances,
+    update_warehouse_balance,
+)
+
+# Small dimension tables that pages list in full on purpose.
+FULL_SCAN_ALLOWED = {
+    "frontend_location",
+    "frontend_glasscategory",
+    "frontend_glasstype",
+    "frontend_clientgroup",
+    "frontend_pricelist",
+    "frontend_pricerule",
+}
+
+SCAN_RE = re.compile(r"^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?$")
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.locations = [Location.objects.create(name=f"Цех {index}") for index in range(3)]
+        cls.group = ClientGroup.objects.create(name="Опт")
+        supplier = Partner.objects.create(partner_type=Partner.SUPPLIER, name="Поставщик")
+        cls.clients = [
+            Partner.objects.create(
+                partner_type=Partner.CLIENT,
+                name=f"Клиент {index}",
+                client_group=cls.group if index % 2 else None,
+            )
+            for index in range(30)
+        ]
+        glass_types = []
+        for index in range(5):
+            category = GlassCategory.objects.create(name=f"Категория {index}")
+            glass_types.append(GlassType.objects.create(category=category, name=category.name))
+
+        price_list = PriceList.objects.create(name="База")
+        PriceRule.objects.create(price_list=price_list, price_per_m2=Decimal("100.00"))
+
+        for index in range(60):
+            WarehouseReceipt.objects.create(
+                location=cls.locations[index % 3],
+                glass_type=glass_types[index % 5],
+                product_code=f"P-{index % 12}",
+                supplier=supplier,
+                width_mm=3210,
+                height_mm=2250,
+                thickness_mm=Decimal("4.00"),
+                quantity=3,
+                total_amount=Decimal("100.00"),
+            )
+
+        sheets = list(WarehouseSheet.objects.filter(location=cls.locations[0])[:20])
+        for index, sheet in enumerate(sheets):
+            Order.objects.create(
+                client=cls.clients[index],
+                warehouse_sheet=sheet,
+                width_mm=1000,
+                height_mm=800,
+                price_per_m2=Decimal("150.00"),
+                waste_percent=Decimal("10.00"),
+                status=Order.STATUS_STARTED if index % 2 else Order.STATUS_DRAFT,
+            )
+        StockTransfer.objects.create(
+            warehouse_sheet=WarehouseSheet.objects.filter(location=cls.locations[0], orders=None).first(),
+            to_location=cls.locations[1],
+        )
+        cls.sheet = sheets[0]
+        cls.glass_type = glass_types[0]
+        search.rebuild_search_index()
+
+    def setUp(self):
+        session = self.client.session
+        session["location_id"] = self.locations[0].pk
+        session.save()
+
+    def assertIndexedPlans(self, queries, allow_full_scan=()):
+        allowed = FULL_SCAN_ALLOWED.union(allow_full_scan)
+        problems = []
+        for query in queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                details = [row[-1] for row in cursor.fetchall()]
+            for detail in details:
+                scan = SCAN_RE.match(detail)
+                if scan and scan.group(1) not in allowed:
+                    problems.append(f"{detail}\n    {sql}")
+                elif "USE TEMP B-TREE" in detail:
+                    problems.append(f"{detail}\n    {sql}")
+        self.assertFalse(problems, "Запросы без индекса:\n" + "\n".join(problems))
+
+    def capture(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return context.captured_queries
+
+    def test_dashboard_pages(self):
+        pages = {
+            "/warehouse/": (),
+            "/orders/": (),
+            # The counterparty page lists every partner on purpose.
+            "/counterparty/": {"frontend_partner"},
+            "/warehouse/categories/": (),
+            "/warehouse/utilization/": (),
+        }
+        for url, allow_full_scan in pages.items():
+            with self.subTest(url=url):
+                queries = self.capture(lambda: self.assertEqual(self.client.get(url).status_code, 200))
+                self.assertIndexedPlans(queries, allow_full_scan)
+
+    def test_conditional_get(self):
+        etag = self.client.get("/orders/")["ETag"]
+        queries = self.capture(
+            lambda: self.assertEqual(self.client.get("/orders/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        )
+        self.assertIndexedPlans(queries)
+
+        self.clients[25].delete()
+        self.assertEqual(self.client.get("/orders/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        last_modified = self.client.get("/counterparty/")["Last-Modified"]
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(seconds=5)):
+            self.clients[26].delete()
+        response = self.client.get("/counterparty/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        self.client.cookies.pop(settings.CSRF_COOKIE_NAME, None)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "x" * 32
+        self.assertEqual(self.client.get("/counterparty/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get("/counterparty/")["ETag"]
+        ClientGroup.objects.create(name="Розница")
+        self.assertEqual(self.client.get("/counterparty/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_utilization_ages_daily(self):
+        response = self.client.get("/warehouse/utilization/")
+        self.assertEqual(response.context["utilization"]["receipts"][0]["age_days"], 0)
+
+        later = timezone.now() + timedelta(days=2)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            response = self.client.get("/warehouse/utilization/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["utilization"]["receipts"][0]["age_days"], 2)
+
+    def test_order_form_post(self):
+        data = {
+            "action": "create_order",
+            "client": self.clients[-1].pk,
+            "warehouse_sheet": WarehouseSheet.objects.filter(location=self.locations[0], orders=None).first().pk,
+            "width_mm": 600,
+            "height_mm": 500,
+            "waste_percent": "5",
+            "status": Order.STATUS_STARTED,
+        }
+        queries = self.capture(lambda: self.assertEqual(self.client.post("/orders/", data).status_code, 302))
+        self.assertIndexedPlans(queries)
+
+    def test_form_posts(self):
+        category = GlassCategory.objects.first()
+        posts = [
+            (
+                "/warehouse/",
+                {
+                    "action": "create_receipt",
+                    "category": category.pk,
+                    "product_code": "P-99",
+                    "supplier": Partner.objects.get(partner_type=Partner.SUPPLIER).pk,
+                    "width_mm": 2000,
+                    "height_mm": 1500,
+                    "thickness_mm": "4",
+                    "quantity": 3,
+                    "total_amount": "100.00",
+                },
+            ),
+            (
+                "/warehouse/",
+                {
+                    "action": "create_transfer",
+                    "warehouse_sheet": WarehouseSheet.objects.filter(location=self.locations[0], orders=None).first().pk,
+                    "to_location": self.locations[2].pk,
+                },
+            ),
+            ("/counterparty/", {"action": "create_partner", "partner_type": Partner.CLIENT, "name": "Новый клиент"}),
+            ("/warehouse/categories/", {"action": "update_category", "category_id": category.pk, "name": "Триплекс"}),
+        ]
+        for url, data in posts:
+            with self.subTest(action=data["action"]):
+                queries = self.capture(lambda: self.assertEqual(self.client.post(url, data).status_code, 302))
+                self.assertIndexedPlans(queries)
+
+    def test_invalid_form_post(self):
+        data = {"action": "create_order", "client": self.clients[0].pk, "width_mm": 0, "height_mm": 500}
+        queries = self.capture(lambda: self.assertEqual(self.client.post("/orders/", data).status_code, 200))
+        self.assertIndexedPlans(queries)
+        self.assertFalse([query for query in queries if "frontend_order" in query["sql"]])
+        response = self.client.post("/orders/", data)
+        self.assertContains(response, 'data-search-url="/search/"')
+        self.assertContains(response, f'<option value="{self.clients[0].pk}" selected>')
+        self.assertContains(response, "client_search.js")
+
+        response = self.client.post("/orders/", data, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("warehouse_sheet", response.json()["errors"])
+
+        category = GlassCategory.objects.first()
+        response = self.client.post(
+            "/warehouse/categories/",
+            {"action": "update_category", "category_id": category.pk, "name": ""},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("name", response.json()["errors"])
+
+    def test_json_endpoints(self):
+        token = self.client.get("/inventory/").json()["token"]
+        requests = [
+            lambda: self.client.get("/search/", {"kind": "partner", "scope": Partner.CLIENT, "q": "клие"}),
+            lambda: self.client.get("/search/", {"kind": "product_code", "q": "P-1"}),
+            lambda: self.client.get("/inventory/"),
+            lambda: self.client.get("/inventory/changes/", {"since": token}),
+            lambda: self.client.post(
+                "/quote/",
+                json.dumps({"sheet_id": self.sheet.pk, "items": [{"width_mm": 500, "height_mm": 400, "quantity": 3}]}),
+                content_type="application/json",
+            ),
+        ]
+        for request in requests:
+            queries = self.capture(lambda: self.assertEqual(request().status_code, 200))
+            self.assertIndexedPlans(queries)
+
+    def test_services(self):
+        pricing.invalidate()
+        services = [
+            (lambda: update_warehouse_balance(self.glass_type, self.locations[0]), ()),
+            # A full recount reads every sheet with stock by design.
+            (aggregate_warehouse_balances, {"frontend_warehousesheet"}),
+            (lambda: pricing.resolve_price(self.glass_type.pk, Decimal("4.00"), self.group.pk), ()),
+            (lambda: inventory.changes(self.locations[0], inventory.make_token(self.sheet.created_at)), ()),
+            (lambda: analytics.compute_utilization(self.locations[0]), ()),
+        ]
+        for service, allow_full_scan in services:
+            self.assertIndexedPlans(self.capture(service), allow_full_scan)
+
+    def test_unbound_instances_do_not_query(self):
+        with self.assertNumQueries(0):
+            Order()
+            WarehouseReceipt()
+            WarehouseBalance()
+
+    def test_reconcile_balances(self):
+        queries = self.capture(lambda: call_command("reconcile_balances", "--dry-run", stdout=StringIO()))
+        # The nightly reconciliation recounts every sheet and compares every stored balance by design.
+        self.assertIndexedPlans(queries, allow_full_scan={"frontend_warehousebalance", "frontend_warehousesheet"})
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.supplier = Partner.objects.create(partner_type=Partner.SUPPLIER, name="Поставщик")
+        cls.category = GlassCategory.objects.create(name="Флоат")
+        cls.glass_type = GlassType.objects.create(category=cls.category, name="Прозрачное")
+
+    def labels(self, kind, query, **kwargs):
+        return [item["label"] for item in search.search(kind, query, **kwargs)]
+
+    def receive(self, product_code):
+        return WarehouseReceipt.objects.create(
+            glass_type=self.glass_type,
+            product_code=product_code,
+            supplier=self.supplier,
+            width_mm=2000,
+            height_mm=1000,
+            thickness_mm=Decimal("4.00"),
+            quantity=1,
+            total_amount=Decimal("100.00"),
+        )
+
+    def test_index_follows_saves_and_deletes(self):
+        partner = Partner.objects.create(partner_type=Partner.CLIENT, name="Ромашка")
+        self.assertEqual(self.labels(search.KIND_PARTNER, "ромаш"), ["Ромашка"])
+        partner.name = "Василек"
+        partner.save()
+        self.assertEqual(self.labels(search.KIND_PARTNER, "ромаш"), [])
+        self.assertEqual(self.labels(search.KIND_PARTNER, "васил"), ["Василек"])
+        partner.delete()
+        self.assertEqual(self.labels(search.KIND_PARTNER, "васил"), [])
+
+        self.assertEqual(self.labels(search.KIND_GLASS_TYPE, "прозр"), [str(self.glass_type)])
+        self.category.name = "Триплекс"
+        self.category.save()
+        self.assertEqual(self.labels(search.KIND_GLASS_TYPE, "трипл"), ["Триплекс / Прозрачное"])
+        self.assertEqual(self.labels(search.KIND_GLASS_TYPE, "флоат"), [])
+
+        receipt = self.receive("ZX-7")
+        self.assertEqual(len(self.labels(search.KIND_PRODUCT_CODE, "zx")), 1)
+        receipt.delete()
+        self.assertEqual(self.labels(search.KIND_PRODUCT_CODE, "zx"), [])
+
+        glass_type = GlassType.objects.create(category=self.category, name="Матовое")
+        self.assertEqual(len(self.labels(search.KIND_GLASS_TYPE, "матов")), 1)
+        glass_type.delete()
+        self.assertEqual(self.labels(search.KIND_GLASS_TYPE, "матов"), [])
+
+    def test_fallback_without_fts(self):
+        Partner.objects.create(partner_type=Partner.CLIENT, name="Ромашка", phone="+998901234567")
+        self.receive("ZX-7")
+        with mock.patch.object(search, "_index_available", False):
+            self.assertEqual(self.labels(search.KIND_PARTNER, "Ромаш"), ["Ромашка (+998901234567)"])
+            self.assertEqual(self.labels(search.KIND_PARTNER, "+99890"), ["Ромашка (+998901234567)"])
+            self.assertEqual(self.labels(search.KIND_GLASS_TYPE, "Флоат"), [str(self.glass_type)])
+            self.assertEqual(len(self.labels(search.KIND_PRODUCT_CODE, "ZX")), 1)
+            self.assertEqual(self.client.get("/search/", {"kind": "partner", "q": "Ромаш"}).status_code, 200)
+
+    def test_repeated_product_codes_do_not_fill_limit(self):
+        for _ in range(5):
+            self.receive("AB-1")
+        self.receive("AB-2")
+        for available in (True, False):
+            with self.subTest(fts=available), mock.patch.object(search, "_index_available", available):
+                codes = [item["product_code"] for item in search.search(search.KIND_PRODUCT_CODE, "AB", limit=2)]
+                self.assertEqual(sorted(codes), ["AB-1", "AB-2"])
+
+    def test_admin_search_returns_every_match(self):
+        Partner.objects.bulk_create(
+            Partner(partner_type=Partner.CLIENT, name=f"Стекольщик {index}") for index in range(600)
+        )
+        search.rebuild_search_index()
+        queryset, _ = admin.site._registry[Partner].get_search_results(None, Partner.objects.all(), "стекол")
+        self.assertEqual(queryset.count(), 600)
+
+    def test_search_limit_is_clamped(self):
+        Partner.objects.create(partner_type=Partner.CLIENT, name="Клиент")
+        search.rebuild_search_index()
+        for limit in ("-5", "0"):
+            response = self.client.get("/search/", {"kind": "partner", "q": "кли", "limit": limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()["results"]), 1)
+
+
+class ReconcileBalancesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = Location.objects.create(name="Цех")
+        supplier = Partner.objects.create(partner_type=Partner.SUPPLIER, name="Поставщик")
+        category = GlassCategory.objects.create(name="Флоат")
+        cls.glass_type = GlassType.objects.create(category=category, name="Флоат")
+        WarehouseReceipt.objects.create(
+            location=cls.location,
+            glass_type=cls.glass_type,
+            product_code="F-1",
+            supplier=supplier,
+            width_mm=3210,
+            height_mm=2250,
+            thickness_mm=Decimal("4.00"),
+            quantity=2,
+            total_amount=Decimal("100.00"),
+        )
+
+    def balance(self):
+        return WarehouseBalance.objects.get(location=self.location, glass_type=self.glass_type)
+
+    def test_fixes_drift(self):
+        WarehouseBalance.objects.filter(pk=self.balance().pk).update(total_sheets=7)
+        call_command("reconcile_balances", stdout=StringIO())
+        self.assertEqual(self.balance().total_sheets, 2)
+
+    def test_keeps_balance_written_during_check(self):
+        compute = reconcile_balances.Command._compute
+
+        def compute_then_consume_sheet(command, workers, chunk_size):
+            expected = compute(command, workers, chunk_size)
+            sheet = WarehouseSheet.objects.filter(location=self.location).order_by("pk").first()
+            sheet.remaining_volume_m2 = 0
+            sheet.save()
+            update_warehouse_balance(self.glass_type, self.location)
+            return expected
+
+        with mock.patch.object(reconcile_balances.Command, "_compute", compute_then_consume_sheet):
+            call_command("reconcile_balances", stdout=StringIO())
+        self.assertEqual(self.balance().total_sheets, 1)
+
+
+class EventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = Location.objects.create(name="Цех")
+        cls.supplier = Partner.objects.create(partner_type=Partner.SUPPLIER, name="Поставщик")
+        cls.client_partner = Partner.objects.create(partner_type=Partner.CLIENT, name="Клиент")
+        category = GlassCategory.objects.create(name="Флоат")
+        cls.glass_type = GlassType.objects.create(category=category, name="Флоат")
+
+    def setUp(self):
+        self.broadcaster = events.LocalBroadcaster()
+        previous = events.set_broadcaster(self.broadcaster)
+        self.addCleanup(events.set_broadcaster, previous)
+
+    def receive_stock(self):
+        return WarehouseReceipt.objects.create(
+            location=self.location,
+            glass_type=self.glass_type,
+            product_code="F-1",
+            supplier=self.supplier,
+            width_mm=2000,
+            height_mm=1000,
+            thickness_mm=Decimal("4.00"),
+            quantity=2,
+            total_amount=Decimal("100.00"),
+        )
+
+    def test_receipt_publishes_balance_on_commit(self):
+        queue = self.broadcaster.subscribe()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.receive_stock()
+        self.assertEqual(self.broadcaster.events, [])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            self.broadcaster.events[-1],
+            (
+                "balance",
+                {
+                    "location_id": self.location.pk,
+                    "glass_type_id": self.glass_type.pk,
+                    "total_sheets": 2,
+                    "total_volume_m2": "4.000",
+                },
+            ),
+        )
+        self.assertEqual(queue.qsize(), len(self.broadcaster.events))
+
+    def test_started_order_publishes_deltas(self):
+        self.receive_stock()
+        sheet = WarehouseSheet.objects.filter(location=self.location).order_by("pk").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                client=self.client_partner,
+                warehouse_sheet=sheet,
+                width_mm=1000,
+                height_mm=1000,
+                price_per_m2=Decimal("150.00"),
+                waste_percent=Decimal("0"),
+                status=Order.STATUS_STARTED,
+            )
+
+        published = dict(self.broadcaster.events)
+        self.assertEqual(published["order"], {"id": order.pk, "status": "started", "status_display": order.get_status_display()})
+        self.assertEqual(published["sheet"], {"id": sheet.pk, "remaining_volume_m2": "1.000"})
+        self.assertEqual(published["balance"]["total_sheets"], 2)
+        self.assertEqual(published["balance"]["total_volume_m2"], "3.000")
+
+
+class QuoteTests(TestCase):
+    # Each case hits a half-way value in one rounding step: order area, paid
+    # waste area and amount, in that order.
+    TIE_CASES = [
+        (1001, 500, "150.00", "10.00"),
+        (1003, 500, "150.00", "10.00"),
+        (100, 500, "150.00", "12.50"),
+        (136, 600, "150.00", "2.50"),
+        (108, 700, "150.50", "10.00"),
+        (283, 700, "123.45", "10.00"),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        supplier = Partner.objects.create(partner_type=Partner.SUPPLIER, name="Поставщик")
+        cls.client_partner = Partner.objects.create(partner_type=Partner.CLIENT, name="Клиент")
+        category = GlassCategory.objects.create(name="Флоат")
+        receipt = WarehouseReceipt.objects.create(
+            glass_type=GlassType.objects.create(category=category, name="Флоат"),
+            product_code="F-1",
+            supplier=supplier,
+            width_mm=3210,
+            height_mm=2250,
+            thickness_mm=Decimal("4.00"),
+            quantity=1,
+            total_amount=Decimal("100.00"),
+        )
+        cls.sheet = receipt.sheets.get()
+
+    def assertQuoteMatchesOrder(self, width_mm, height_mm, price_per_m2, waste_percent):
+        order = Order.objects.create(
+            client=self.client_partner,
+            warehouse_sheet=self.sheet,
+            width_mm=width_mm,
+            height_mm=height_mm,
+            price_per_m2=Decimal(price_per_m2),
+            waste_percent=Decimal(waste_percent),
+        )
+        order.refresh_from_db()
+        quote = quoting.quote_batch(
+            [(width_mm, height_mm, 1)], self.sheet.width_mm, self.sheet.height_mm, price_per_m2, waste_percent
+        )
+        line = quote["lines"][0]
+        self.assertEqual(
+            (line["order_volume_m2"], line["waste_volume_m2"], line["unit_amount"]),
+            (order.order_volume_m2, order.waste_volume_m2, order.total_amount),
+        )
+
+    def test_half_even_ties(self):
+        for case in self.TIE_CASES:
+            with self.subTest(case=case):
+                self.assertQuoteMatchesOrder(*case)
+
+    def test_random_orders(self):
+        rng = random.Random(31)
+        for _ in range(200):
+            case = (
+                rng.randint(1, 3210),
+                rng.randint(1, 2250),
+                f"{rng.randint(1, 100000) / 100:.2f}",
+                f"{rng.randint(0, 10000) / 100:.2f}",
+            )
+            with self.subTest(case=case):
+                self.assertQuoteMatchesOrder(*case)
+
+
+class PricingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = GlassCategory.objects.create(name="Флоат")
+        cls.float_glass = GlassType.objects.create(category=category, name="Флоат")
+        cls.mirror = GlassType.objects.create(category=category, name="Зеркало")
+        cls.group = ClientGroup.objects.create(name="Опт")
+
+        general = PriceList.objects.create(name="База")
+        cls.general_rule = PriceRule.objects.create(price_list=general, price_per_m2=Decimal("100.00"))
+        PriceRule.objects.create(price_list=general, glass_type=cls.float_glass, price_per_m2=Decimal("120.00"))
+        PriceRule.objects.create(
+            price_list=general,
+            glass_type=cls.float_glass,
+            min_thickness_mm=Decimal("8.00"),
+            max_thickness_mm=Decimal("12.00"),
+            price_per_m2=Decimal("180.00"),
+        )
+        for min_volume, price in (("10.000", "110.00"), ("50.000", "95.00")):
+            PriceRule.objects.create(
+                price_list=general,
+                glass_type=cls.float_glass,
+                min_volume_m2=Decimal(min_volume),
+                price_per_m2=Decimal(price),
+            )
+
+        wholesale = PriceList.objects.create(name="Опт", client_group=cls.group)
+        PriceRule.objects.create(price_list=wholesale, price_per_m2=Decimal("90.00"))
+        PriceList.objects.create(name="Архив", is_active=False).rules.create(
+            glass_type=cls.mirror, price_per_m2=Decimal("1.00")
+        )
+
+    def setUp(self):
+        pricing.invalidate()
+
+    def resolve(self, glass_type, thickness="4.00", client_group_id=None, volume="0.000"):
+        return pricing.resolve_price(glass_type.pk, Decimal(thickness), client_group_id, Decimal(volume))
+
+    def test_specific_glass_type_before_all_types(self):
+        self.assertEqual(self.resolve(self.float_glass), Decimal("120.00"))
+        self.assertEqual(self.resolve(self.mirror), Decimal("100.00"))
+
+    def test_client_group_before_general(self):
+        self.assertEqual(self.resolve(self.float_glass, client_group_id=self.group.pk), Decimal("90.00"))
+        self.assertEqual(self.resolve(self.mirror, client_group_id=self.group.pk), Decimal("90.00"))
+
+    def test_thickness_bands(self):
+        self.assertEqual(self.resolve(self.float_glass, "8.00"), Decimal("180.00"))
+        self.assertEqual(self.resolve(self.float_glass, "12.00"), Decimal("180.00"))
+        self.assertEqual(self.resolve(self.float_glass, "12.01"), Decimal("120.00"))
+        self.assertEqual(self.resolve(self.float_glass, "7.99"), Decimal("120.00"))
+
+    def test_narrower_band_with_same_lower_bound_wins(self):
+        price_list = PriceList.objects.create(name="Зеркала")
+        PriceRule.objects.create(price_list=price_list, glass_type=self.mirror, price_per_m2=Decimal("200.00"))
+        PriceRule.objects.create(
+            price_list=price_list,
+            glass_type=self.mirror,
+            max_thickness_mm=Decimal("6.00"),
+            price_per_m2=Decimal("150.00"),
+        )
+        pricing.invalidate()
+        self.assertEqual(self.resolve(self.mirror, "4.00"), Decimal("150.00"))
+        self.assertEqual(self.resolve(self.mirror, "6.01"), Decimal("200.00"))
+
+    def test_volume_tiers(self):
+        for volume, price in (("9.999", "120.00"), ("10.000", "110.00"), ("49.999", "110.00"), ("50.000", "95.00")):
+            with self.subTest(volume=volume):
+                self.assertEqual(self.resolve(self.float_glass, volume=volume), Decimal(price))
+
+    def test_inactive_price_list_is_ignored(self):
+        self.assertEqual(self.resolve(self.mirror), Decimal("100.00"))
+
+    def test_saving_rule_invalidates_compiled_table(self):
+        self.assertEqual(self.resolve(self.mirror), Decimal("100.00"))
+        self.general_rule.price_per_m2 = Decimal("105.00")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.general_rule.save()
+        self.assertEqual(self.resolve(self.mirror), Decimal("105.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.general_rule.delete()
+        self.assertIsNone(self.resolve(self.mirror))
+
+
+class InventoryTokenTests(TestCase):
+    def test_changes_contents(self):
+        first, second = Location.objects.create(name="Цех А"), Location.objects.create(name="Цех Б")
+        category = GlassCategory.objects.create(name="Флоат")
+        glass_type = GlassType.objects.create(category=category, name="Флоат")
+        supplier = Partner.objects.create(partner_type=Partner.SUPPLIER, name="Поставщик")
+        client = Partner.objects.create(partner_type=Partner.CLIENT, name="Клиент")
+        earlier = timezone.now() - timedelta(hours=1)
+        with mock.patch("django.utils.timezone.now", return_value=earlier):
+            receipts = [
+                WarehouseReceipt.objects.create(
+                    location=first,
+                    glass_type=glass_type,
+                    product_code=f"F-{index}",
+                    supplier=supplier,
+                    width_mm=2000,
+                    height_mm=1000,
+                    thickness_mm=Decimal("4.00"),
+                    quantity=1,
+                    total_amount=Decimal("100.00"),
+                )
+                for index in range(5)
+            ]
+        token = inventory.make_token(earlier + timedelta(minutes=30))
+        untouched, cut, used_up, moved, deleted = [receipt.sheets.get() for receipt in receipts]
+
+        Order.objects.create(
+            client=client,
+            warehouse_sheet=cut,
+            width_mm=1000,
+            height_mm=1000,
+            price_per_m2=Decimal("100.00"),
+            status=Order.STATUS_STARTED,
+        )
+        used_up.remaining_volume_m2 = Decimal("0.000")
+        used_up.save()
+        StockTransfer.objects.create(warehouse_sheet=moved, to_location=second)
+        receipts[4].delete()
+
+        delta = inventory.changes(first, token)
+        self.assertEqual([row[0] for row in delta["sheets"]], [cut.pk])
+        self.assertEqual(delta["sheets"][0][-1], "1.000")
+        self.assertEqual(delta["removed_sheet_ids"], sorted([used_up.pk, moved.pk, deleted.pk]))
+        self.assertNotIn(untouched.pk, delta["removed_sheet_ids"])
+        self.assertEqual(delta["sheet_count"], 2)
+        self.assertEqual(delta["balances"], [[glass_type.pk, 2, "3.000"]])
+
+        delta = inventory.changes(second, token)
+        self.assertEqual([row[0] for row in delta["sheets"]], [moved.pk])
+        self.assertEqual(delta["removed_sheet_ids"], [])
+
+    def test_bad_tokens_are_rejected(self):
+        for token in ("", "abc", "-5", "1.5", "²", "١٢٣", "99999999999999999999999", "9" * 400):
+            with self.subTest(token=token):
+                response = self.client.get("/inventory/changes/", {"since": token})
+                self.assertEqual(response.status_code, 400)
+
+    def test_token_round_trip(self):
+        token = self.client.get("/inventory/").json()["token"]
+        self.assertEqual(self.client.get("/inventory/changes/", {"since": token}).status_code, 200)
+
+
+class LoadtestInvariantTests(TestCase):
+    def test_missing_balance_row_is_drift(self):
+        location = Location.objects.create(name="Цех")
+        category = GlassCategory.objects.create(name="Флоат")
+        WarehouseReceipt.objects.create(
+            location=location,
+            glass_type=GlassType.objects.create(category=category, name="Флоат"),
+            product_code="F-1",
+            supplier=Partner.objects.create(partner_type=Partner.SUPPLIER, name="Поставщик"),
+            width_mm=2000,
+            height_mm=1000,
+            thickness_mm=Decimal("4.00"),
+            quantity=1,
+            total_amount=Decimal("100.00"),
+        )
+        command = loadtest.Command(stdout=StringIO())
+        self.assertTrue(command._check_invariants())
+
+        WarehouseBalance.objects.all().delete()
+        self.assertFalse(command._check_invariants())
+
+
+class LocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.first, cls.second = Location.objects.create(name="Цех А"), Location.objects.create(name="Цех Б")
+        cls.supplier = Partner.objects.create(partner_type=Partner.SUPPLIER, name="Поставщик")
+        cls.client_partner = Partner.objects.create(partner_type=Partner.CLIENT, name="Клиент")
+        category = GlassCategory.objects.create(name="Флоат")
+        cls.glass_type = GlassType.objects.create(category=category, name="Флоат")
+        for location, code in ((cls.first, "A-1"), (cls.second, "B-1")):
+            WarehouseReceipt.objects.create(
+                location=location,
+                glass_type=cls.glass_type,
+                product_code=code,
+                supplier=cls.supplier,
+                width_mm=2000,
+                height_mm=1000,
+                thickness_mm=Decimal("4.00"),
+                quantity=2,
+                total_amount=Decimal("100.00"),
+            )
+
+    def balance(self, location):
+        balance = WarehouseBalance.objects.get(location=location, glass_type=self.glass_type)
+        return balance.total_sheets, balance.total_volume_m2
+
+    def sheet(self, location):
+        return WarehouseSheet.objects.filter(location=location).order_by("pk").first()
+
+    def order(self, sheet, status=Order.STATUS_DRAFT):
+        return Order.objects.create(
+            client=self.client_partner,
+            warehouse_sheet=sheet,
+            width_mm=1000,
+            height_mm=1000,
+            price_per_m2=Decimal("100.00"),
+            waste_percent=Decimal("0"),
+            status=status,
+        )
+
+    def test_transfer_moves_balance_between_locations(self):
+        StockTransfer.objects.create(warehouse_sheet=self.sheet(self.first), to_location=self.second)
+        self.assertEqual(self.balance(self.first), (1, Decimal("2.000")))
+        self.assertEqual(self.balance(self.second), (3, Decimal("6.000")))
+
+    def test_sheet_with_open_orders_cannot_move(self):
+        sheet = self.sheet(self.first)
+        order = self.order(sheet)
+        form = StockTransferForm({"warehouse_sheet": sheet.pk, "to_location": self.second.pk}, location=self.first)
+        self.assertFalse(form.is_valid())
+        with self.assertRaises(ValidationError):
+            StockTransfer.objects.create(warehouse_sheet=sheet, to_location=self.second)
+
+        order.status = Order.STATUS_CANCELLED
+        order.save()
+        StockTransfer.objects.create(warehouse_sheet=sheet, to_location=self.second)
+        self.assertEqual(self.sheet(self.second).pk, sheet.pk)
+
+    def test_order_is_booked_where_the_sheet_is_cut(self):
+        sheet = self.sheet(self.first)
+        order = self.order(sheet)
+        sheet.location = self.second
+        sheet.save()
+        order.status = Order.STATUS_STARTED
+        order.save()
+        self.assertEqual(order.location_id, self.second.pk)
+        self.assertEqual(order.waste_record.location_id, self.second.pk)
+
+    def test_pages_show_only_their_location(self):
+        self.order(self.sheet(self.first), Order.STATUS_STARTED)
+        self.order(self.sheet(self.second), Order.STATUS_STARTED)
+        for location, own, other in ((self.first, "A-1", "B-1"), (self.second, "B-1", "A-1")):
+            with self.subTest(location=location.name):
+                response = self.client.get("/warehouse/", {"location": location.pk})
+                self.assertContains(response, own)
+                self.assertNotContains(response, other)
+                self.assertEqual([row["total_sheets"] for row in response.context["warehouse_balance_rows"]], [2])
+                self.assertEqual(
+                    {order.location_id for order in self.client.get("/orders/").context["orders"]}, {location.pk}
+                )
+                sheet_ids = [row[0] for row in self.client.get("/inventory/").json()["sheets"]]
+                sheet_locations = WarehouseSheet.objects.filter(pk__in=sheet_ids).values_list("location_id", flat=True)
+                self.assertEqual(set(sheet_locations), {location.pk})
+
+    def test_get_without_session_does_not_create_location(self):
+        self.assertEqual(self.client.get("/inventory/").status_code, 200)
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_utilization_follows_sheets(self):
+        order = self.order(self.sheet(self.first))
+        order.waste_percent = Decimal("10")
+        order.status = Order.STATUS_STARTED
+        order.save()
+        StockTransfer.objects.create(
+            warehouse_sheet=WarehouseSheet.objects.filter(location=self.first).order_by("pk").last(),
+            to_location=self.second,
+        )
+
+        def numbers(location):
+            (row,) = [row for row in analytics.compute_utilization(location)["receipts"] if row["label"].endswith("A-1")]
+            fields = ("received_m2", "ordered_m2", "waste_m2", "idle_m2", "used_percent", "waste_percent", "idle_percent")
+            return tuple(row[field] for field in fields)
 
-# Create your tests here.
+        self.assertEqual(
+            numbers(self.first),
+            (Decimal("2.000"), Decimal("1.000"), Decimal("0.100"), Decimal("0.900"), 50, 5, 45),
+        )
+        self.assertEqual(
+            numbers(self.second),
+            (Decimal("2.000"), Decimal("0.000"), Decimal("0.000"), Decimal("2.000"), 0, 0, 100),
+        )
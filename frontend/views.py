@@ -1,22 +1,89 @@
+import datetime
+import hashlib
+import json
 from collections import defaultdict
+from decimal import Decimal, InvalidOperation
 
 from django.contrib import messages
+from django.db import connection
 from django.db.models import Sum
+from django.http import JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
 from django.views import View
+from django.views.decorators.gzip import gzip_page
 
-from .forms import GlassCategoryForm, OrderForm, PartnerForm, WarehouseReceiptForm
-from .models import GlassCategory, Order, Partner, WarehouseBalance, WarehouseReceipt, WasteRecord
+from . import analytics, inventory, pricing, quoting, search
+from .forms import (
+    GlassCategoryForm,
+    LocationFormMixin,
+    OrderForm,
+    PartnerForm,
+    StockTransferForm,
+    WarehouseReceiptForm,
+)
+from .models import (
+    ClientGroup,
+    DeletionCounter,
+    GlassCategory,
+    GlassType,
+    Location,
+    Order,
+    Partner,
+    WarehouseBalance,
+    WarehouseReceipt,
+    WarehouseSheet,
+    WasteRecord,
+    default_location,
+)
 
 
 class DashboardSectionView(View):
     template_name = "frontend/dashboard.html"
     active_tab = "warehouse"
     warehouse_view = "overview"
+    version_models = (
+        ClientGroup,
+        GlassCategory,
+        GlassType,
+        Location,
+        Order,
+        Partner,
+        WarehouseBalance,
+        WarehouseReceipt,
+        WarehouseSheet,
+        WasteRecord,
+    )
+
+    def dispatch(self, request, *args, **kwargs):
+        self.location = self._current_location(request)
+        return super().dispatch(request, *args, **kwargs)
 
     def get(self, request):
+        # Pending flash messages are part of the page, so never answer 304 over them.
+        if len(messages.get_messages(request)):
+            etag, last_modified = None, None
+        else:
+            etag, last_modified = self._data_version()
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+        self.data_version = etag
+
         context = self._build_context(active_tab=self.active_tab, warehouse_view=self.warehouse_view)
-        return render(request, self.template_name, context)
+        response = render(request, self.template_name, context)
+        if etag:
+            response["ETag"] = etag
+            if last_modified:
+                response["Last-Modified"] = http_date(last_modified)
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
 
     def post(self, request):
         action = request.POST.get("action")
@@ -26,6 +93,7 @@ class DashboardSectionView(View):
             "create_category": (GlassCategoryForm, "Категория стекла добавлена.", "warehouse_categories"),
             "create_receipt": (WarehouseReceiptForm, "Поступление на склад добавлено.", "warehouse"),
             "create_order": (OrderForm, "Заказ создан.", "orders"),
+            "create_transfer": (StockTransferForm, "Лист перемещен на другой склад.", "warehouse"),
         }
 
         if action == "update_category":
@@ -33,19 +101,18 @@ class DashboardSectionView(View):
 
         if action not in form_map:
             messages.error(request, "Неизвестное действие формы.")
-            return redirect(self.active_tab_url_name)
+            return self._redirect(request, self.active_tab_url_name)
 
         form_class, success_message, target_url_name = form_map[action]
-        form = form_class(request.POST)
+        form_kwargs = {"location": self.location} if issubclass(form_class, LocationFormMixin) else {}
+        form = form_class(request.POST, **form_kwargs)
 
         if form.is_valid():
             form.save()
             messages.success(request, success_message)
-            return redirect(target_url_name)
+            return self._redirect(request, target_url_name)
 
-        context = self._build_context(active_tab=self.active_tab, warehouse_view=self.warehouse_view)
-        context[f"{action}_form"] = form
-        return render(request, self.template_name, context)
+        return self._invalid_form(request, form, action)
 
     def _update_category(self, request):
         category_id = request.POST.get("category_id")
@@ -55,31 +122,104 @@ class DashboardSectionView(View):
         if form.is_valid():
             form.save()
             messages.success(request, "Категория стекла обновлена.")
-            return redirect("warehouse_categories")
+            return self._redirect(request, "warehouse_categories")
+
+        return self._invalid_form(request, form, "update_category", hidden={"category_id": category.id})
+
+    @staticmethod
+    def _wants_json(request):
+        return "application/json" in request.headers.get("Accept", "")
+
+    def _redirect(self, request, url_name):
+        if self._wants_json(request):
+            return JsonResponse({"redirect": reverse(url_name)})
+        return redirect(url_name)
 
-        context = self._build_context(active_tab="warehouse", warehouse_view="categories")
-        context["category_edit_form"] = form
-        context["editing_category_id"] = category.id
-        return render(request, "frontend/warehouse_categories.html", context)
+    def _invalid_form(self, request, form, action, hidden=None):
+        # Answer with the bound form alone: rebuilding the whole section would
+        # re-run every page query just to show a few error messages.
+        if self._wants_json(request):
+            return JsonResponse({"errors": form.errors.get_json_data()}, status=400)
+        context = {
+            "active_tab": self.active_tab,
+            "warehouse_view": self.warehouse_view,
+            "current_location": self.location,
+            "locations": Location.objects.all(),
+            "form": form,
+            "action": action,
+            "hidden": hidden or {},
+            "back_url": reverse(self.active_tab_url_name),
+        }
+        return render(request, "frontend/form_errors.html", context)
 
     @property
     def active_tab_url_name(self):
         tab_to_url_name = {
             "counterparty": "counterparty",
             "orders": "orders",
-            "warehouse": "warehouse_categories" if self.warehouse_view == "categories" else "warehouse",
+            "warehouse": {
+                "categories": "warehouse_categories",
+                "utilization": "warehouse_utilization",
+            }.get(self.warehouse_view, "warehouse"),
         }
         return tab_to_url_name[self.active_tab]
 
+    @staticmethod
+    def _current_location(request):
+        location_id = request.GET.get("location") or request.session.get("location_id")
+        location = None
+        if location_id and str(location_id).isdigit():
+            location = Location.objects.filter(pk=location_id).first()
+        if location is None:
+            location = default_location()
+        if request.session.get("location_id") != location.pk:
+            request.session["location_id"] = location.pk
+        return location
+
+    def _data_version(self):
+        # MAX() over the updated_at index and the rowid are single lookups; rows
+        # removed without touching either are tracked by DeletionCounter, whose
+        # updated_at also moves Last-Modified.
+        counters = DeletionCounter._meta.db_table
+        tables = [model._meta.db_table for model in self.version_models]
+        selects = ", ".join(
+            f"(SELECT MAX(updated_at) FROM {table}), "
+            f"(SELECT updated_at FROM {counters} WHERE \"table\" = '{table}'), "
+            f"(SELECT MAX(id) FROM {table}), "
+            f"(SELECT deletions FROM {counters} WHERE \"table\" = '{table}')"
+            for table in tables
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {selects}")
+            row = cursor.fetchone()
+
+        timestamps = []
+        for value in (value for index, value in enumerate(row) if index % 4 < 2 and value is not None):
+            if isinstance(value, str):
+                value = parse_datetime(value)
+            if timezone.is_naive(value):
+                value = timezone.make_aware(value, datetime.timezone.utc)
+            timestamps.append(value)
+        last_modified = int(max(timestamps).timestamp()) if timestamps else None
+
+        # A page cached under another CSRF token would fail with 403 on submit.
+        get_token(self.request)
+        csrf_cookie = self.request.META.get("CSRF_COOKIE")
+        version = f"{self.template_name}:{self.warehouse_view}:{self.location.pk}:{csrf_cookie}:" + ":".join(
+            str(value) for value in row
+        )
+        return quote_etag(hashlib.md5(version.encode()).hexdigest()), last_modified
+
     def _build_context(self, active_tab, warehouse_view="overview"):
-        warehouse_balances = list(
-            WarehouseBalance.objects.select_related("glass_type", "glass_type__category").order_by(
-                "glass_type__category__name", "glass_type__name"
-            )
+        location = self.location
+        warehouse_balances = sorted(
+            WarehouseBalance.objects.filter(location=location).select_related("glass_type", "glass_type__category"),
+            key=lambda balance: (balance.glass_type.category.name, balance.glass_type.name),
         )
 
-        size_pairs = WarehouseReceipt.objects.values_list("glass_type_id", "width_mm", "height_mm").distinct()
-        product_code_pairs = WarehouseReceipt.objects.values_list("glass_type_id", "product_code").distinct()
+        location_receipts = WarehouseReceipt.objects.filter(location=location)
+        size_pairs = location_receipts.values_list("glass_type_id", "width_mm", "height_mm").order_by().distinct()
+        product_code_pairs = location_receipts.values_list("glass_type_id", "product_code").order_by().distinct()
         size_map = defaultdict(set)
         product_code_map = defaultdict(set)
         for glass_type_id, width_mm, height_mm in size_pairs:
@@ -93,6 +233,7 @@ class DashboardSectionView(View):
             sizes = sorted(size_map.get(balance.glass_type_id, []))
             warehouse_balance_rows.append(
                 {
+                    "glass_type_id": balance.glass_type_id,
                     "category_name": balance.glass_type.category.name,
                     "product_codes": ", ".join(sorted(product_code_map.get(balance.glass_type_id, []))) or "—",
                     "size_display": ", ".join(sizes) if sizes else "—",
@@ -104,49 +245,221 @@ class DashboardSectionView(View):
         total_sheets = sum(balance.total_sheets for balance in warehouse_balances)
         total_volume = sum(balance.total_volume_m2 for balance in warehouse_balances)
 
-        create_order_form = OrderForm()
+        location_waste = WasteRecord.objects.filter(location=location)
+        create_order_form = OrderForm(location=location)
         return {
             "active_tab": active_tab,
             "warehouse_view": warehouse_view,
+            "current_location": location,
+            "locations": Location.objects.all(),
             "create_partner_form": PartnerForm(),
             "create_category_form": GlassCategoryForm(),
-            "create_receipt_form": WarehouseReceiptForm(),
+            "create_receipt_form": WarehouseReceiptForm(location=location),
             "create_order_form": create_order_form,
+            "create_transfer_form": StockTransferForm(location=location),
             "partners": Partner.objects.order_by("-created_at"),
-            "warehouse_receipts": WarehouseReceipt.objects.select_related(
+            "warehouse_receipts": location_receipts.select_related(
                 "glass_type", "glass_type__category", "supplier"
             ).order_by("-created_at"),
             "warehouse_balance_rows": warehouse_balance_rows,
             "categories": GlassCategory.objects.order_by("name"),
-            "orders": Order.objects.select_related(
+            "orders": Order.objects.filter(location=location).select_related(
                 "client", "warehouse_sheet", "warehouse_sheet__glass_type", "warehouse_sheet__glass_type__category"
             ),
-            "waste_records": WasteRecord.objects.select_related("order", "warehouse_sheet")[:10],
-            "category_edit_form": None,
-            "editing_category_id": None,
+            "waste_records": location_waste.select_related("order", "warehouse_sheet")[:10],
             "total_sheets": total_sheets,
             "total_volume": total_volume,
-            "total_waste_volume": WasteRecord.objects.aggregate(total=Sum("waste_volume_m2"))["total"] or 0,
-            "total_waste_amount": WasteRecord.objects.aggregate(total=Sum("waste_amount"))["total"] or 0,
+            "total_waste_volume": location_waste.aggregate(total=Sum("waste_volume_m2"))["total"] or 0,
+            "total_waste_amount": location_waste.aggregate(total=Sum("waste_amount"))["total"] or 0,
         }
 
 
 class CounterpartyView(DashboardSectionView):
     template_name = "frontend/counterparty.html"
     active_tab = "counterparty"
+    version_models = (ClientGroup, Location, Partner)
 
 
 class OrdersView(DashboardSectionView):
     template_name = "frontend/orders.html"
     active_tab = "orders"
+    version_models = (GlassCategory, GlassType, Location, Order, Partner, WarehouseSheet)
 
 
 class WarehouseView(DashboardSectionView):
     template_name = "frontend/warehouse.html"
     active_tab = "warehouse"
+    version_models = (
+        GlassCategory,
+        GlassType,
+        Location,
+        Partner,
+        WarehouseBalance,
+        WarehouseReceipt,
+        WarehouseSheet,
+        WasteRecord,
+    )
 
 
 class WarehouseCategoriesView(DashboardSectionView):
     template_name = "frontend/warehouse_categories.html"
     active_tab = "warehouse"
-    warehouse_view = "categories"
\ No newline at end of file
+    warehouse_view = "categories"
+    version_models = (GlassCategory, Location)
+
+
+@method_decorator(gzip_page, name="dispatch")
+class InventorySnapshotView(View):
+    def get(self, request):
+        location = DashboardSectionView._current_location(request)
+        return JsonResponse(inventory.snapshot(location))
+
+
+@method_decorator(gzip_page, name="dispatch")
+class InventoryChangesView(View):
+    def get(self, request):
+        location = DashboardSectionView._current_location(request)
+        try:
+            return JsonResponse(inventory.changes(location, request.GET.get("since")))
+        except inventory.InvalidToken as error:
+            return JsonResponse({"error": str(error)}, status=400)
+
+
+class SearchView(View):
+    kinds = (search.KIND_PARTNER, search.KIND_PRODUCT_CODE, search.KIND_GLASS_TYPE)
+    max_limit = 50
+
+    def get(self, request):
+        kind = request.GET.get("kind", search.KIND_PARTNER)
+        if kind not in self.kinds:
+            return JsonResponse({"error": "Неизвестный тип поиска."}, status=400)
+
+        try:
+            limit = max(1, min(int(request.GET.get("limit", 20)), self.max_limit))
+        except ValueError:
+            limit = 20
+
+        results = search.search(kind, request.GET.get("q", ""), scope=request.GET.get("scope") or None, limit=limit)
+        return JsonResponse({"results": results})
+
+
+class WarehouseUtilizationView(DashboardSectionView):
+    template_name = "frontend/warehouse_utilization.html"
+    active_tab = "warehouse"
+    warehouse_view = "utilization"
+    version_models = (GlassCategory, GlassType, Location, Order, Partner, WarehouseReceipt, WarehouseSheet, WasteRecord)
+
+    def _data_version(self):
+        # Days in stock grow without any write, so the page also changes daily.
+        etag, last_modified = super()._data_version()
+        today = timezone.localdate()
+        etag = quote_etag(hashlib.md5(f"{etag}:{today.isoformat()}".encode()).hexdigest())
+        day_start = int(timezone.make_aware(datetime.datetime.combine(today, datetime.time.min)).timestamp())
+        return etag, max(last_modified or 0, day_start)
+
+    def _build_context(self, active_tab, warehouse_view="overview"):
+        context = super()._build_context(active_tab, warehouse_view)
+        context["utilization"] = analytics.utilization(self.location, version=getattr(self, "data_version", None))
+        return context
+
+
+class QuoteView(View):
+    max_items = 5000
+
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+            sheet_width_mm, sheet_height_mm, glass_type_id, thickness_mm = self._sheet(payload)
+            waste_percent = self._decimal(payload, "waste_percent", Decimal("0.00"), Decimal("100.00"))
+            items = self._items(payload)
+            if payload.get("price_per_m2") is not None:
+                price_per_m2 = self._decimal(payload, "price_per_m2", Decimal("0.00"), None)
+            else:
+                price_per_m2 = self._list_price(payload, items, glass_type_id, thickness_mm)
+        except (ValueError, TypeError, AttributeError) as error:
+            message = str(error) if isinstance(error, quoting.QuoteError) else "Некорректные данные расчета."
+            return JsonResponse({"error": message}, status=400)
+
+        quote = quoting.quote_batch(items, sheet_width_mm, sheet_height_mm, price_per_m2, waste_percent)
+        return JsonResponse(
+            {
+                "sheet_width_mm": sheet_width_mm,
+                "sheet_height_mm": sheet_height_mm,
+                "price_per_m2": str(price_per_m2),
+                "waste_percent": str(waste_percent),
+                "lines": [
+                    {key: str(value) if isinstance(value, Decimal) else value for key, value in line.items()}
+                    for line in quote["lines"]
+                ],
+                "total_quantity": quote["total_quantity"],
+                "order_volume_m2": str(quote["order_volume_m2"]),
+                "waste_volume_m2": str(quote["waste_volume_m2"]),
+                "total_amount": str(quote["total_amount"]),
+            }
+        )
+
+    @staticmethod
+    def _sheet(payload):
+        if payload.get("sheet_id"):
+            sheet = (
+                WarehouseSheet.objects.filter(pk=payload["sheet_id"])
+                .values_list("width_mm", "height_mm", "glass_type_id", "thickness_mm")
+                .first()
+            )
+            if sheet is None:
+                raise quoting.QuoteError("Лист не найден.")
+            return sheet
+        return (
+            QuoteView._positive_int(payload.get("sheet_width_mm")),
+            QuoteView._positive_int(payload.get("sheet_height_mm")),
+            None,
+            None,
+        )
+
+    @staticmethod
+    def _list_price(payload, items, glass_type_id, thickness_mm):
+        if glass_type_id is None:
+            raise quoting.QuoteError("Укажите price_per_m2 или sheet_id для цены из прайс-листа.")
+        client_group_id = None
+        if payload.get("client_id"):
+            client_group_id = Partner.objects.filter(pk=payload["client_id"]).values_list("client_group_id", flat=True).first()
+        volume_units = sum(quoting.area_units(width_mm, height_mm) * quantity for width_mm, height_mm, quantity in items)
+        price = pricing.resolve_price(
+            glass_type_id, thickness_mm, client_group_id=client_group_id, volume_m2=Decimal(volume_units).scaleb(-3)
+        )
+        if price is None:
+            raise quoting.QuoteError("Для этого стекла нет цены в прайс-листе.")
+        return price
+
+    @staticmethod
+    def _positive_int(value):
+        if isinstance(value, bool) or not isinstance(value, (int, str)) or int(value) <= 0:
+            raise quoting.QuoteError("Размеры должны быть положительными целыми числами (мм).")
+        return int(value)
+
+    @staticmethod
+    def _decimal(payload, key, minimum, maximum):
+        try:
+            value = Decimal(str(payload.get(key, "0")))
+        except InvalidOperation:
+            raise quoting.QuoteError(f"Некорректное значение {key}.")
+        if not value.is_finite() or value.as_tuple().exponent < -2:
+            raise quoting.QuoteError(f"{key}: не более двух знаков после запятой.")
+        if value < minimum or (maximum is not None and value > maximum):
+            raise quoting.QuoteError(f"{key}: значение вне допустимого диапазона.")
+        return value
+
+    def _items(self, payload):
+        raw_items = payload.get("items")
+        if not isinstance(raw_items, list) or not raw_items:
+            raise quoting.QuoteError("Передайте список позиций items.")
+        if len(raw_items) > self.max_items:
+            raise quoting.QuoteError(f"Не более {self.max_items} позиций в одном расчете.")
+        return [
+            (
+                self._positive_int(item.get("width_mm")),
+                self._positive_int(item.get("height_mm")),
+                self._positive_int(item.get("quantity", 1)),
+            )
+            for item in raw_items
+        ]
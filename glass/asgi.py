@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'glass.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from frontend.events import sse_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == "/events/":
+        await sse_application(scope, receive, send)
+        return
+    await django_application(scope, receive, send)
@@ -77,7 +77,7 @@ WSGI_APPLICATION = 'glass.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('GLASS_DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
     }
 }
 
@@ -19,7 +19,17 @@ from django.contrib import admin
 from django.urls import path
 from django.views.generic import RedirectView
 
-from frontend.views import CounterpartyView, OrdersView, WarehouseCategoriesView, WarehouseView
+from frontend.views import (
+    CounterpartyView,
+    InventoryChangesView,
+    InventorySnapshotView,
+    OrdersView,
+    QuoteView,
+    SearchView,
+    WarehouseCategoriesView,
+    WarehouseUtilizationView,
+    WarehouseView,
+)
 
 urlpatterns = [
     path('', RedirectView.as_view(pattern_name='warehouse', permanent=False)),
@@ -27,6 +37,11 @@ urlpatterns = [
     path('orders/', OrdersView.as_view(), name='orders'),
     path('warehouse/', WarehouseView.as_view(), name='warehouse'),
     path('warehouse/categories/', WarehouseCategoriesView.as_view(), name='warehouse_categories'),
+    path('warehouse/utilization/', WarehouseUtilizationView.as_view(), name='warehouse_utilization'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('quote/', QuoteView.as_view(), name='quote'),
+    path('inventory/', InventorySnapshotView.as_view(), name='inventory'),
+    path('inventory/changes/', InventoryChangesView.as_view(), name='inventory_changes'),
     path('admin/', admin.site.urls),
 ]
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
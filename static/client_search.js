@@ -0,0 +1,66 @@
+(function () {
+  const setupClientSearch = (client) => {
+    const search = document.createElement('input');
+    search.type = 'search';
+    search.className = 'form-control';
+    search.placeholder = 'Начните вводить имя или телефон клиента';
+    search.autocomplete = 'off';
+    const results = document.createElement('div');
+    results.className = 'list-group mt-1';
+    client.hidden = true;
+    client.after(search, results);
+
+    const selected = client.options[client.selectedIndex];
+    if (selected && selected.value) search.value = selected.text;
+
+    const choose = (item) => {
+      let option = Array.from(client.options).find((opt) => opt.value === String(item.id));
+      if (!option) {
+        option = new Option(item.label, item.id);
+        client.add(option);
+      }
+      client.value = String(item.id);
+      search.value = item.label;
+      results.replaceChildren();
+      client.dispatchEvent(new Event('change'));
+    };
+
+    let timer = null;
+    let controller = null;
+    search.addEventListener('input', () => {
+      clearTimeout(timer);
+      if (!search.value.trim()) {
+        client.value = '';
+        results.replaceChildren();
+        client.dispatchEvent(new Event('change'));
+        return;
+      }
+      timer = setTimeout(() => {
+        if (controller) controller.abort();
+        controller = new AbortController();
+        const params = new URLSearchParams({
+          kind: client.dataset.searchKind,
+          scope: client.dataset.searchScope,
+          q: search.value,
+        });
+        fetch(`${client.dataset.searchUrl}?${params}`, { signal: controller.signal })
+          .then((response) => response.json())
+          .then((data) => {
+            results.replaceChildren(
+              ...data.results.map((item) => {
+                const button = document.createElement('button');
+                button.type = 'button';
+                button.className = 'list-group-item list-group-item-action';
+                button.textContent = item.label;
+                button.addEventListener('click', () => choose(item));
+                return button;
+              })
+            );
+          })
+          .catch(() => {});
+      }, 200);
+    });
+  };
+
+  document.querySelectorAll('select[data-search-url]').forEach(setupClientSearch);
+})();
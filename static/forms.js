@@ -0,0 +1,61 @@
+(function () {
+  if (!window.fetch || !window.FormData) return;
+
+  const clearErrors = (form) => {
+    form.querySelectorAll('[data-form-error]').forEach((el) => el.remove());
+    form.querySelectorAll('.is-invalid').forEach((el) => el.classList.remove('is-invalid'));
+  };
+
+  const showErrors = (form, errors) => {
+    Object.entries(errors).forEach(([name, fieldErrors]) => {
+      const text = fieldErrors.map((error) => error.message).join(' ');
+      const field = name === '__all__' ? null : form.elements[name];
+      const feedback = document.createElement('div');
+      feedback.dataset.formError = '';
+      feedback.textContent = text;
+      if (field && field.closest) {
+        field.classList.add('is-invalid');
+        feedback.className = 'small text-danger';
+        (field.closest('p') || field.parentElement).append(feedback);
+      } else {
+        feedback.className = 'alert alert-danger py-2 mb-1';
+        form.prepend(feedback);
+      }
+    });
+  };
+
+  document.querySelectorAll('form[method="post"]').forEach((form) => {
+    form.addEventListener('submit', (event) => {
+      event.preventDefault();
+      const buttons = form.querySelectorAll('[type="submit"]');
+      buttons.forEach((button) => { button.disabled = true; });
+      fetch(form.action, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: { Accept: 'application/json' },
+        credentials: 'same-origin',
+      })
+        .then((response) => {
+          if (!(response.headers.get('Content-Type') || '').includes('application/json')) throw new Error(response.status);
+          return response.json();
+        })
+        .then((data) => {
+          if (data.redirect) {
+            window.location.assign(data.redirect);
+            return;
+          }
+          clearErrors(form);
+          showErrors(form, data.errors || {});
+          buttons.forEach((button) => { button.disabled = false; });
+        })
+        .catch(() => {
+          // The server may already have saved the form, so never resend it automatically.
+          clearErrors(form);
+          showErrors(form, {
+            __all__: [{ message: 'Не удалось получить ответ сервера. Обновите страницу и проверьте, сохранились ли данные, прежде чем отправлять форму снова.' }],
+          });
+          buttons.forEach((button) => { button.disabled = false; });
+        });
+    });
+  });
+})();
@@ -0,0 +1,39 @@
+(function () {
+  const url = document.body.dataset.eventsUrl;
+  const hasLiveRows = document.querySelector('[data-glass-type-id], [data-order-id], [data-sheet-id]');
+  if (!url || !hasLiveRows || !window.EventSource) return;
+
+  const setField = (root, field, value) => {
+    root.querySelectorAll(`[data-field="${field}"]`).forEach((el) => {
+      el.textContent = value;
+    });
+  };
+
+  const source = new EventSource(url);
+
+  source.addEventListener('balance', (event) => {
+    const data = JSON.parse(event.data);
+    if (String(data.location_id) !== document.body.dataset.locationId) return;
+    document.querySelectorAll(`[data-glass-type-id="${data.glass_type_id}"]`).forEach((row) => {
+      setField(row, 'total_sheets', data.total_sheets);
+      setField(row, 'total_volume_m2', data.total_volume_m2);
+    });
+  });
+
+  source.addEventListener('sheet', (event) => {
+    const data = JSON.parse(event.data);
+    document.querySelectorAll(`[data-sheet-id="${data.id}"]`).forEach((el) => {
+      el.textContent = data.remaining_volume_m2;
+    });
+    document.querySelectorAll(`option[value="${data.id}"][data-remaining-volume-m2]`).forEach((option) => {
+      option.dataset.remainingVolumeM2 = data.remaining_volume_m2;
+    });
+  });
+
+  source.addEventListener('order', (event) => {
+    const data = JSON.parse(event.data);
+    document.querySelectorAll(`[data-order-id="${data.id}"]`).forEach((row) => {
+      setField(row, 'status_display', data.status_display);
+    });
+  });
+})();